@@ -0,0 +1,18 @@
+"""
+WSGI entry point for benchmarks: mastercard_api_app backed by fake_mysql.
+
+    gunicorn --bind 127.0.0.1:8000 benchmarks.bench_app:app
+
+BENCH_DB_LATENCY_MS / BENCH_DB_CONNECT_MS set the injected per-round-trip and
+connect (TCP+TLS+auth) latencies.
+"""
+import os
+
+from benchmarks import fake_mysql
+
+fake_mysql.install(
+    latency_ms=float(os.getenv("BENCH_DB_LATENCY_MS", "2")),
+    connect_latency_ms=float(os.getenv("BENCH_DB_CONNECT_MS", "30")),
+)
+
+from mastercard_api_app import app  # noqa: E402,F401  (must import after install)
@@ -0,0 +1,152 @@
+"""
+In-process stand-in for the Aiven MySQL server used by mastercard_api_app.
+
+Implements just the statements the app issues against PAYMENT_REQUEST, backed
+by a dict. Each round trip (connect, execute, executemany, commit, rollback,
+ping) sleeps for an injectable latency and is counted, so benchmarks can report
+DB round trips per request without a network or a real database.
+The table lives in the worker process: every gunicorn worker has its own copy.
+"""
+import sys
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+_lock = threading.Lock()
+_rows = {}            # REQUEST_ID -> row dict
+_by_reference = {}    # REFERENCE -> REQUEST_ID
+_config = {"latency": 0.0, "connect_latency": 0.0}
+
+INSERT_COLUMNS = [
+    "REQUEST_ID", "REFERENCE", "VENDOR_ID", "AMOUNT", "CURRENCY", "STATUS",
+    "RECEIVED_AT", "LAST_UPDATED", "CPI_RESPONSE",
+    "PAYER_ACC_NO", "PAYER_IFSC", "VENDOR_IFSC", "VENDOR_BANK_NAME",
+    "VENDOR_BRANCH", "VENDOR_ACC_TYPE", "VCC_CARD_NO", "VCC_STATUS", "PAYMENT_DUE_DATE",
+]
+
+
+def _round_trip(kind, latency=None):
+    """Sleeps like a network round trip and counts it in the app's /metrics."""
+    time.sleep(_config["latency"] if latency is None else latency)
+    app_module = sys.modules.get("mastercard_api_app")
+    if app_module is not None and hasattr(app_module, "metrics"):
+        app_module.metrics.inc("bench_db_round_trips_total", (("kind", kind),))
+
+
+class FakeCursor:
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._dictionary = dictionary
+        self._result = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        _round_trip("execute")
+        self._connection.in_transaction = True   # autocommit is off, as in mysql-connector
+        statement = " ".join(sql.split())
+        params = list(params or ())
+        self._result = []
+        self.rowcount = 0
+        with _lock:
+            if statement.startswith("SELECT REQUEST_ID FROM PAYMENT_REQUEST WHERE REFERENCE = %s"):
+                # Like MySQL, 'REFERENCE = NULL' matches nothing.
+                request_id = _by_reference.get(str(params[0])) if params[0] is not None else None
+                self._result = [{"REQUEST_ID": request_id}] if request_id else []
+            elif statement.startswith("SELECT REFERENCE, REQUEST_ID FROM PAYMENT_REQUEST WHERE REFERENCE IN"):
+                self._result = [
+                    {"REFERENCE": ref, "REQUEST_ID": _by_reference[ref]}
+                    for ref in map(str, params) if ref in _by_reference
+                ]
+            elif statement.startswith("SELECT * FROM PAYMENT_REQUEST WHERE REQUEST_ID = %s"):
+                row = _rows.get(params[0])
+                self._result = [dict(row)] if row else []
+            elif statement.startswith("INSERT INTO PAYMENT_REQUEST"):
+                self._insert(params)
+            elif statement.startswith("UPDATE PAYMENT_REQUEST SET STATUS = %s, LAST_UPDATED = %s WHERE REFERENCE IN"):
+                status, last_updated = params[0], params[1]
+                for ref in map(str, params[2:]):
+                    request_id = _by_reference.get(ref)
+                    if request_id:
+                        _rows[request_id].update(STATUS=status, LAST_UPDATED=last_updated)
+                        self.rowcount += 1
+            else:
+                raise Error(f"fake_mysql: unsupported statement: {statement[:80]}")
+        if self._result:
+            self.rowcount = len(self._result)
+
+    def executemany(self, sql, seq_params):
+        # mysql-connector rewrites INSERT executemany into one multi-row statement.
+        _round_trip("executemany")
+        self._connection.in_transaction = True
+        with _lock:
+            for params in seq_params:
+                self._insert(list(params))
+
+    def _insert(self, params):
+        row = dict(zip(INSERT_COLUMNS, params))
+        _rows[row["REQUEST_ID"]] = row
+        if row["REFERENCE"] is not None:
+            _by_reference[str(row["REFERENCE"])] = row["REQUEST_ID"]
+        self.rowcount += 1
+
+    def _format(self, row):
+        return row if self._dictionary else tuple(row.values())
+
+    def fetchone(self):
+        return self._format(self._result.pop(0)) if self._result else None
+
+    def fetchmany(self, size=1):
+        rows, self._result = self._result[:size], self._result[size:]
+        return [self._format(r) for r in rows]
+
+    def fetchall(self):
+        rows, self._result = self._result, []
+        return [self._format(r) for r in rows]
+
+    def close(self):
+        self._result = []
+
+
+class FakeConnection:
+    def __init__(self):
+        _round_trip("connect", _config["connect_latency"])
+        self._open = True
+        self.in_transaction = False
+        self.unread_result = False
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return FakeCursor(self, dictionary=dictionary)
+
+    def is_connected(self):
+        _round_trip("ping")
+        return self._open
+
+    def commit(self):
+        _round_trip("commit")
+        self.in_transaction = False
+
+    def rollback(self):
+        _round_trip("rollback")
+        self.in_transaction = False
+
+    def close(self):
+        self._open = False
+
+
+def fake_connect(**kwargs):
+    return FakeConnection()
+
+
+def install(latency_ms=0.0, connect_latency_ms=0.0):
+    """Replaces mysql.connector.connect; call BEFORE importing mastercard_api_app."""
+    _config["latency"] = latency_ms / 1000.0
+    _config["connect_latency"] = connect_latency_ms / 1000.0
+    mysql.connector.connect = fake_connect
+
+
+def reset():
+    with _lock:
+        _rows.clear()
+        _by_reference.clear()
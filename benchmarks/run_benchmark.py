@@ -0,0 +1,387 @@
+"""
+Load test / benchmark for the Mastercard payment API.
+
+Starts gunicorn with the CMD from the repo's Dockerfile (app module swapped for
+benchmarks.bench_app, i.e. the real app backed by fake_mysql), drives a
+realistic request mix, and reports p50/p95/p99 latency, requests per second and
+DB round trips per request (read from /metrics).
+
+    python -m benchmarks.run_benchmark --duration 30 --concurrency 16
+    python -m benchmarks.run_benchmark --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --compare benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --url http://localhost:8000   # existing server
+
+The fixed --seed makes the request sequence reproducible run to run.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scenario -> weight in the request mix
+DEFAULT_MIX = {
+    "submit_new": 55,
+    "submit_duplicate": 15,
+    "submit_invalid_amount": 5,
+    "get_transaction": 15,
+    "health": 5,
+    "settlement": 5,
+}
+
+
+# --- Payloads ---
+
+def payment_payload(rng, invoice, amount=None):
+    return {
+        "vendorId": f"V{rng.randint(1000, 9999)}",
+        "invoice": invoice,
+        "amount": amount if amount is not None else round(rng.uniform(10, 50000), 2),
+        "currency": "INR",
+        "payerAcctNum": "001234567890",
+        "payerIFSC": "HDFC0000123",
+        "vendorIFSC": "ICIC0000456",
+        "vendorBankName": "ICICI Bank",
+        "vendorBranch": "Chennai",
+        "vendorBankAccountType": "CURRENT",
+        "vccCardNum": None,
+        "vccStatus": None,
+        "paymentDueDate": "2026-12-31",
+    }
+
+
+class Workload:
+    """Shared, thread-safe state: invoices already submitted and their REQUEST_IDs."""
+
+    def __init__(self, mix, seed):
+        self._lock = threading.Lock()
+        self._scenarios = list(mix)
+        self._weights = [mix[name] for name in self._scenarios]
+        self._seed = seed
+        self.invoices = []
+        self.request_ids = []
+
+    def rng(self, worker_index):
+        return random.Random(self._seed * 1000 + worker_index)
+
+    def next_request(self, rng):
+        scenario = rng.choices(self._scenarios, self._weights)[0]
+        with self._lock:
+            invoices = list(self.invoices[-1000:])
+            request_ids = list(self.request_ids[-1000:])
+        # Fall back to a new submission until there is something to retry / read.
+        if scenario in ("submit_duplicate", "settlement") and not invoices:
+            scenario = "submit_new"
+        if scenario == "get_transaction" and not request_ids:
+            scenario = "submit_new"
+
+        if scenario == "submit_new":
+            invoice = f"INV-{uuid.UUID(int=rng.getrandbits(128)).hex[:16]}"
+            return scenario, "POST", "/mastercard/submit_payment", payment_payload(rng, invoice)
+        if scenario == "submit_duplicate":
+            return scenario, "POST", "/mastercard/submit_payment", payment_payload(rng, rng.choice(invoices))
+        if scenario == "submit_invalid_amount":
+            return scenario, "POST", "/mastercard/submit_payment", payment_payload(rng, f"BAD-{rng.getrandbits(32)}", amount=-1)
+        if scenario == "get_transaction":
+            return scenario, "GET", f"/transactions/{rng.choice(request_ids)}", None
+        if scenario == "health":
+            return scenario, "GET", "/health", None
+        return scenario, "POST", "/mastercard/receive_settlement_confirmation", {
+            "reference": rng.choice(invoices),
+            "status": rng.choice(["SETTLED", "SETTLED", "SETTLED", "FAILED"]),
+        }
+
+    def record_submission(self, invoice, request_id):
+        with self._lock:
+            self.invoices.append(invoice)
+            if request_id:
+                self.request_ids.append(request_id)
+
+
+# --- Server lifecycle ---
+
+def dockerfile_gunicorn_args():
+    """gunicorn argv from the Dockerfile CMD, minus bind and app module."""
+    with open(os.path.join(REPO_ROOT, "Dockerfile")) as fh:
+        match = re.search(r"^CMD\s+(\[.*\])\s*$", fh.read(), re.MULTILINE)
+    argv = json.loads(match.group(1)) if match else ["gunicorn", "mastercard_api_app:app"]
+    args, skip = [], False
+    for arg in argv[1:]:
+        if skip:
+            skip = False
+        elif arg in ("--bind", "-b"):
+            skip = True
+        elif arg.startswith("--bind=") or arg.endswith(":app"):
+            continue
+        else:
+            args.append(arg)
+    return args
+
+
+def gunicorn_worker_count(argv):
+    """Worker count requested by a gunicorn argv (--workers/-w), else WEB_CONCURRENCY, else 1."""
+    workers = os.environ.get("WEB_CONCURRENCY", "1")
+    for index, arg in enumerate(argv):
+        if arg in ("--workers", "-w") and index + 1 < len(argv):
+            workers = argv[index + 1]
+        elif arg.startswith("--workers="):
+            workers = arg.split("=", 1)[1]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            workers = arg[2:]
+    return int(workers)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, metrics_dir):
+    gunicorn_args = dockerfile_gunicorn_args() + shlex.split(args.gunicorn_args)
+    # fake_mysql keeps its table per process: with several workers a payment
+    # submitted on one is invisible to the others and lookups 404.
+    if gunicorn_worker_count(gunicorn_args) > 1:
+        raise SystemExit("fake_mysql is per worker; run the benchmark with a single gunicorn worker (use --threads to scale).")
+    port = free_port()
+    cmd = (
+        [sys.executable, "-m", "gunicorn"] + gunicorn_args
+        + ["--bind", f"127.0.0.1:{port}", "benchmarks.bench_app:app"]
+    )
+    env = dict(
+        os.environ,
+        BENCH_DB_LATENCY_MS=str(args.db_latency_ms),
+        BENCH_DB_CONNECT_MS=str(args.db_connect_ms),
+        METRICS_DIR=metrics_dir,
+        METRICS_FLUSH_INTERVAL="0.2",
+        LOG_LEVEL="WARNING",
+    )
+    print(f"Starting: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {proc.returncode}")
+        try:
+            requests.get(url + "/health", timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not become ready within 30s")
+
+
+def db_round_trips(url, fake_db=True):
+    """
+    Sum of mastercard_api_bench_db_round_trips_total across workers, or None if
+    /metrics is unavailable. Against bench_app (fake_db) a missing series just
+    means no round trips yet (e.g. DB warm-up still running); a server started
+    elsewhere (--url) may not count round trips at all, so that is None too.
+    """
+    try:
+        text = requests.get(url + "/metrics", timeout=5).text
+    except requests.RequestException:
+        return None
+    values = re.findall(r"^mastercard_api_bench_db_round_trips_total\{[^}]*\} (\S+)$", text, re.MULTILINE)
+    if not values and not fake_db:
+        return None
+    return sum(float(v) for v in values)
+
+
+# --- Load generation ---
+
+def run_load(url, workload, duration, concurrency, warmup):
+    samples = {}  # scenario -> [latency_ms, ...]
+    errors = {}   # scenario -> count of transport errors / 5xx responses
+    sent = [0]    # every request, including warm-up (DB round trips are counted from the start)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + warmup + duration
+    measure_from = time.monotonic() + warmup
+
+    def worker(index):
+        rng = workload.rng(index)
+        session = requests.Session()
+        local_samples, local_errors, local_sent = {}, {}, 0
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            scenario, method, path, body = workload.next_request(rng)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url + path, json=body, timeout=30)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                response, ok = None, False
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            local_sent += 1
+
+            if response is not None and scenario in ("submit_new", "submit_duplicate") and response.status_code == 202:
+                workload.record_submission(body["invoice"], response.json().get("request_id"))
+            if now >= measure_from:
+                local_samples.setdefault(scenario, []).append(elapsed_ms)
+                if not ok:
+                    local_errors[scenario] = local_errors.get(scenario, 0) + 1
+        with lock:
+            sent[0] += local_sent
+            for scenario, values in local_samples.items():
+                samples.setdefault(scenario, []).extend(values)
+            for scenario, count in local_errors.items():
+                errors[scenario] = errors.get(scenario, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, sent[0]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank: the smallest value with at least pct% of samples at or below it.
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values, duration):
+    values = sorted(values)
+    return {
+        "requests": len(values),
+        "rps": round(len(values) / duration, 2),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+
+# --- Baselines ---
+
+def compare(result, baseline, threshold_pct):
+    """Prints deltas vs. the baseline; returns the list of regressions."""
+    regressions = []
+    print(f"\nComparison vs baseline ({baseline.get('created_at', '?')}):")
+    for scope, current in [("overall", result["overall"])] + sorted(result["scenarios"].items()):
+        previous = baseline["overall"] if scope == "overall" else baseline["scenarios"].get(scope)
+        if not previous:
+            continue
+        for key, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("rps", False)):
+            before, after = previous[key], current[key]
+            if not before:
+                continue
+            change = (after - before) / before * 100.0
+            worse = change > threshold_pct if higher_is_worse else change < -threshold_pct
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {scope:<22} {key:<7} {before:>10.3f} -> {after:>10.3f} ({change:+6.1f}%){flag}")
+            if worse:
+                regressions.append(f"{scope}.{key}")
+    before, after = baseline.get("db_round_trips_per_request"), result.get("db_round_trips_per_request")
+    if before and after:
+        change = (after - before) / before * 100.0
+        worse = change > threshold_pct
+        print(f"  {'overall':<22} db_rt/req {before:>8.3f} -> {after:>10.3f} ({change:+6.1f}%){'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append("overall.db_round_trips_per_request")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting gunicorn.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds (default 20).")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured warm-up seconds (default 3).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads (default 8).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for a reproducible request sequence.")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="Injected latency per DB round trip.")
+    parser.add_argument("--db-connect-ms", type=float, default=30.0, help="Injected latency per DB connect (TLS handshake).")
+    parser.add_argument("--gunicorn-args", default="", help="Extra gunicorn arguments, e.g. '--threads 4' (one worker only).")
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX, help="JSON scenario->weight map.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results as a JSON baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved JSON baseline.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent (default 10).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    proc = None
+    metrics_dir = tempfile.mkdtemp(prefix="bench_metrics_")
+    url = args.url
+    if not url:
+        proc, url = start_server(args, metrics_dir)
+    try:
+        workload = Workload(args.mix, args.seed)
+        rt_before = db_round_trips(url, fake_db=proc is not None)
+        samples, errors, total_sent = run_load(url, workload, args.duration, args.concurrency, args.warmup)
+        time.sleep(0.5)  # Let every worker publish its metrics snapshot
+        rt_after = db_round_trips(url, fake_db=proc is not None)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    all_values = [v for values in samples.values() for v in values]
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "db_latency_ms": args.db_latency_ms,
+            "db_connect_ms": args.db_connect_ms,
+            "gunicorn": dockerfile_gunicorn_args() + shlex.split(args.gunicorn_args),
+            "mix": args.mix,
+            "url": args.url,
+        },
+        "overall": summarize(all_values, args.duration),
+        "scenarios": {name: summarize(values, args.duration) for name, values in sorted(samples.items())},
+        "errors": errors,
+        "db_round_trips_per_request": (
+            round((rt_after - rt_before) / total_sent, 3)
+            if rt_before is not None and rt_after is not None and total_sent else None
+        ),
+    }
+
+    print(f"\n{'scenario':<24}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for scope, stats in [("overall", result["overall"])] + list(result["scenarios"].items()):
+        print(f"{scope:<24}{stats['requests']:>10}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"DB round trips per request: {result['db_round_trips_per_request']}")
+    if errors:
+        print(f"Errors: {errors}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as fh:
+            json.dump(result, fh, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(result, json.load(fh), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
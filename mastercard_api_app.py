@@ -2,11 +2,31 @@ import os
 import json
 import uuid
 import datetime
+import time
+import threading
+import collections
+import contextlib
+import atexit
+import queue
+import base64
+import csv
+import io
+import bisect
+import logging
+import random
+import tempfile
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process journal locking
+    fcntl = None
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify
 import mysql.connector
 from mysql.connector import Error
 
+# Worker cold-start accounting (third-party imports above are not included)
+_IMPORT_STARTED = time.perf_counter()
+
 # --- Flask Application Initialization ---
 app = Flask(__name__)
 
@@ -21,151 +41,1600 @@ DB_NAME = os.getenv('MYSQL_DATABASE', 'mastercard_db')
 # Aiven SSL Certificate Authority file path (REQUIRED FOR CONNECTION)
 SSL_CA_CERT_PATH = os.getenv('SSL_CA_CERT_PATH', 'ca.pem') 
 
+# --- Connection Pool Configuration ---
+# One pool per gunicorn worker (the module is imported separately in every worker).
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))                          # Max open connections per worker
+DB_POOL_PREWARM = int(os.getenv('DB_POOL_PREWARM', str(DB_POOL_SIZE)))      # Connections opened at worker start
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '2.0'))                # Max seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))     # Recycle connections older than this (seconds)
+DB_POOL_VALIDATE_IDLE = float(os.getenv('DB_POOL_VALIDATE_IDLE', '5'))      # Ping on checkout if idle longer than this (seconds)
+
+# --- Batch Submission Configuration ---
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '10000'))                # Max payloads accepted per batch request
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '500'))                # Rows per IN (...) lookup / executemany
+
+# --- Write-Behind Journal Configuration ---
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', '0') == '1'         # Acknowledge after local fsync, drain to DB async
+PAYMENT_JOURNAL_PATH = os.getenv('PAYMENT_JOURNAL_PATH', 'payment_journal.jsonl')  # Dead letters go to <path>.dead
+JOURNAL_GROUP_SIZE = int(os.getenv('JOURNAL_GROUP_SIZE', '500'))            # Records per drain transaction (group commit)
+JOURNAL_DRAIN_INTERVAL = float(os.getenv('JOURNAL_DRAIN_INTERVAL', '0.2'))  # Seconds to sleep when caught up / after failure
+JOURNAL_MAX_LAG_BYTES = int(os.getenv('JOURNAL_MAX_LAG_BYTES', str(64 * 1024 * 1024)))  # Backpressure threshold
+JOURNAL_COMPACT_BYTES = int(os.getenv('JOURNAL_COMPACT_BYTES', str(16 * 1024 * 1024)))  # Truncate once drained past this
+JOURNAL_RETRY_AFTER = int(os.getenv('JOURNAL_RETRY_AFTER', '5'))            # Retry-After seconds under backpressure
+
+# --- Idempotency Cache Configuration ---
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '50000'))   # Max invoices remembered per worker (0 disables)
+IDEMPOTENCY_CACHE_TTL = float(os.getenv('IDEMPOTENCY_CACHE_TTL', '3600'))   # Seconds an invoice -> REQUEST_ID entry stays valid
+
+# --- Settlement Ingestion Configuration ---
+SETTLEMENT_QUEUE_SIZE = int(os.getenv('SETTLEMENT_QUEUE_SIZE', '100000'))   # Max queued confirmations per worker
+SETTLEMENT_BATCH_SIZE = int(os.getenv('SETTLEMENT_BATCH_SIZE', '5000'))     # Max confirmations coalesced per flush
+SETTLEMENT_FLUSH_INTERVAL = float(os.getenv('SETTLEMENT_FLUSH_INTERVAL', '0.5'))  # Max seconds an update waits before flushing
+SETTLEMENT_SHUTDOWN_TIMEOUT = float(os.getenv('SETTLEMENT_SHUTDOWN_TIMEOUT', '10'))  # Max seconds spent flushing on worker exit
+SETTLEMENT_SHUTDOWN_RETRIES = int(os.getenv('SETTLEMENT_SHUTDOWN_RETRIES', '3'))  # Failed flushes tolerated on worker exit
+SETTLEMENT_STATUS_MAX_LENGTH = int(os.getenv('SETTLEMENT_STATUS_MAX_LENGTH', '50'))  # Must fit PAYMENT_REQUEST.STATUS
+SETTLEMENT_ALLOWED_STATUSES = {s.strip() for s in os.getenv('SETTLEMENT_ALLOWED_STATUSES', '').split(',') if s.strip()}  # Empty = any
+
+# --- Transaction Query / Export Configuration ---
+TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', '100'))    # Default rows per /transactions page
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv('TRANSACTIONS_MAX_PAGE_SIZE', '1000'))
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '1000'))             # Rows fetched per round trip while streaming
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '2'))        # Concurrent exports per worker (each opens its own connection)
+
+# --- Transaction Read Cache Configuration ---
+TRANSACTION_CACHE_SIZE = int(os.getenv('TRANSACTION_CACHE_SIZE', '10000'))  # Max cached transactions per worker (0 disables)
+TRANSACTION_CACHE_TTL = float(os.getenv('TRANSACTION_CACHE_TTL', '10'))     # Seconds a cached row may be served
+TRANSACTION_NEGATIVE_TTL = float(os.getenv('TRANSACTION_NEGATIVE_TTL', '2'))  # Seconds an unknown REQUEST_ID stays cached
+
+# --- Metrics Configuration ---
+METRICS_PREFIX = "mastercard_api_"
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'mastercard_api_metrics'))  # Shared by all workers; '' = this worker only
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))    # Seconds between per-worker snapshot writes
+METRICS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '500'))                # Requests slower than this may be logged
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '0.1'))  # Fraction of slow requests logged (0 disables)
+
+# --- Health Probe Configuration ---
+HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '10'))     # Seconds between background DB probes
+
+# --- Logging & Metrics ---
+# Standard logging (level via LOG_LEVEL); gunicorn collects stderr.
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format="%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s",
+)
+logger = logging.getLogger("mastercard_api")
+
+class MetricsRegistry:
+    """
+    Per-worker counters and latency histograms with cheap, lock-protected updates.
+    Each worker periodically writes a JSON snapshot to METRICS_DIR; /metrics
+    merges the snapshots of ALL workers, so totals are correct behind gunicorn
+    no matter which worker serves the scrape. Counters and histograms of exited
+    workers are folded into one archive file, so the directory stays bounded and
+    totals never go backwards when a pid is reused.
+    """
+
+    ARCHIVE_FILE = "archive.json"
+
+    def __init__(self, buckets, directory):
+        self.buckets = buckets
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)   # (name, labels) -> value
+        self._histograms = {}                               # (name, labels) -> [bucket counts..., +Inf, sum]
+        self._counter_collectors = []
+        self._gauge_collectors = []
+        self._flusher = None
+        self._instance = (None, None)                       # (pid, id) of this process incarnation
+        self._published = None                              # instance id whose snapshot file this process owns
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def observe(self, name, seconds, labels=()):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def register_counters(self, collector):
+        """'collector()' returns [(name, labels, value), ...] of cumulative per-worker totals."""
+        self._counter_collectors.append(collector)
+
+    def register_gauges(self, collector):
+        """'collector()' returns [(name, labels, value), ...] read at snapshot time."""
+        self._gauge_collectors.append(collector)
+
+    def _instance_id(self):
+        # Regenerated after fork, so a child never inherits its parent's identity.
+        if self._instance[0] != os.getpid():
+            self._instance = (os.getpid(), uuid.uuid4().hex)
+        return self._instance[1]
+
+    @staticmethod
+    def _run_collectors(collectors):
+        values = []
+        for collector in collectors:
+            try:
+                values.extend([name, list(labels), value] for name, labels, value in collector())
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        counters.extend(self._run_collectors(self._counter_collectors))
+        gauges = self._run_collectors(self._gauge_collectors)
+        return {"pid": os.getpid(), "instance": self._instance_id(),
+                "counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def _worker_path(self, pid):
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path, data):
+        # A unique temp file: the flusher thread and a /metrics request may write at once.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".snapshot-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        """Serialises archiving and scrapes across workers (best effort without fcntl)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+
+    def _archive(self, snapshots, paths):
+        """Folds counters/histograms into ARCHIVE_FILE, then deletes 'paths'. Caller holds the lock."""
+        archive_path = os.path.join(self.directory, self.ARCHIVE_FILE)
+        archived = self._read(archive_path) or {"counters": [], "histograms": []}
+        counters, histograms = merge_snapshot_totals([archived] + snapshots)
+        self._write(archive_path, {
+            "pid": None,
+            "counters": [[name, [list(label) for label in labels], value] for (name, labels), value in counters.items()],
+            "histograms": [[name, [list(label) for label in labels], values] for (name, labels), values in histograms.items()],
+            "gauges": [],
+        })
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _archive_exited_workers(self):
+        """Archives snapshot files whose worker has exited. Caller holds the lock."""
+        exited, paths = [], []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith("worker-") and filename.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, filename)
+            snap = self._read(path)
+            if snap and snap["pid"] != os.getpid() and not _pid_alive(snap["pid"]):
+                exited.append(snap)
+                paths.append(path)
+        if exited:
+            self._archive(exited, paths)
+
+    def write_snapshot(self):
+        """Publishes this worker's snapshot for cross-worker aggregation."""
+        if not self.directory:
+            return
+        snap = self.snapshot()
+        path = self._worker_path(snap["pid"])
+        if self._published == snap["instance"]:
+            self._write(path, snap)
+            return
+        # First write of this process: a file under our pid is left over from an
+        # earlier worker that died with the same pid, so archive it, don't overwrite it.
+        with self._directory_lock():
+            previous = self._read(path)
+            if previous and previous.get("instance") != snap["instance"]:
+                self._archive([previous], [path])
+            self._write(path, snap)
+        self._published = snap["instance"]
+
+    def retire(self):
+        """Folds this worker's final totals into the archive on clean exit (atexit)."""
+        if not self.directory or self._published != self._instance_id():
+            return
+        try:
+            with self._directory_lock():
+                self._archive([self.snapshot()], [self._worker_path(os.getpid())])
+        except OSError as e:
+            logger.warning("Metrics archive write failed: %s", e)
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning("Metrics snapshot write failed: %s", e)
+
+    def start_flusher(self):
+        if self.directory and not (self._flusher and self._flusher.is_alive()):
+            self._flusher = threading.Thread(target=self._flush_forever, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+
+    def collect_all(self):
+        """Snapshots of every live worker plus the archive; falls back to this worker only."""
+        if not self.directory:
+            return [self.snapshot()]
+        try:
+            self.write_snapshot()
+            with self._directory_lock():
+                self._archive_exited_workers()
+                snapshots = []
+                for filename in os.listdir(self.directory):
+                    if filename.endswith(".json"):
+                        snap = self._read(os.path.join(self.directory, filename))
+                        if snap:
+                            snapshots.append(snap)
+        except OSError as e:
+            logger.warning("Metrics snapshot aggregation failed: %s", e)
+            return [self.snapshot()]
+        return snapshots
+
+    def render_prometheus(self):
+        """Merges worker snapshots into Prometheus text exposition format."""
+        snapshots = self.collect_all()
+        counters, histograms = merge_snapshot_totals(snapshots)
+        gauges = []
+        for snap in snapshots:
+            if snap["gauges"] and _pid_alive(snap["pid"]):
+                # Gauges are point-in-time per worker; drop those of exited workers.
+                for name, labels, value in snap["gauges"]:
+                    gauges.append((name, tuple(map(tuple, labels)) + (("pid", str(snap["pid"])),), value))
+
+        lines = []
+        for metric_type, series in (("counter", counters.items()), ("gauge", [(gauge[:2], gauge[2]) for gauge in gauges])):
+            seen = set()
+            for (name, labels), value in sorted(series):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {METRICS_PREFIX}{name} {metric_type}")
+                lines.append(f"{METRICS_PREFIX}{name}{_format_labels(labels)} {value}")
+
+        seen = set()
+        for (name, labels), values in sorted(histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{METRICS_PREFIX}{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            cumulative += values[len(self.buckets)]
+            lines.append(f"{METRICS_PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{METRICS_PREFIX}{name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshot_totals(snapshots):
+    """Sums counters and histograms across snapshots, keyed by (name, labels)."""
+    counters = collections.defaultdict(float)
+    histograms = {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(values))
+            histograms[key] = [a + b for a, b in zip(merged, values)]
+    return counters, histograms
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+metrics = MetricsRegistry(METRICS_BUCKETS, METRICS_DIR)
+# Registered first so it runs last, after other atexit hooks have recorded their metrics.
+atexit.register(metrics.retire)
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    """
+    Times one hot-path stage (connect, idempotency SELECT, INSERT, commit, ...).
+    Inside a request the timing is also kept for the slow-request log.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", elapsed, (("stage", stage),))
+        if has_request_context():
+            g.setdefault("stage_timings", []).append((stage, elapsed))
+
+def count_db_error(operation):
+    metrics.inc("db_errors_total", (("operation", operation),))
+
+# MySQL errors caused by the data itself (too long, bad value, constraint):
+# retrying the same statement can never succeed.
+PERMANENT_DB_ERRORS = (mysql.connector.DataError, mysql.connector.IntegrityError)
+
+
 # --- Database Connection Utilities ---
 
-def get_db_connection():
-    """Establishes and returns a MySQL database connection with SSL configured."""
+def create_db_connection():
+    """Establishes and returns a NEW MySQL database connection with SSL configured."""
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            port=DB_PORT,
-            # --- CONNECTION FIX: Aiven requires SSL CA file ---
-            ssl_ca=SSL_CA_CERT_PATH, 
-        )
+        with stage_timer("db_connect"):
+            conn = mysql.connector.connect(
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS,
+                port=DB_PORT,
+                # --- CONNECTION FIX: Aiven requires SSL CA file ---
+                ssl_ca=SSL_CA_CERT_PATH, 
+            )
         return conn
     except Error as e:
-        print(f"MySQL Database connection failed: {e}")
+        count_db_error("connect")
+        logger.error("MySQL Database connection failed: %s", e)
         return None
 
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a pooled MySQL connection.
+    close() hands the connection back to the pool instead of closing the socket,
+    so existing handlers (which call conn.close() in 'finally') work unchanged.
+    """
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn, self._created_at)
+            self._conn = None
+
+    def discard(self):
+        """Closes the underlying socket instead of pooling it (e.g. after an aborted stream)."""
+        if self._conn is not None:
+            self._pool.release(self._conn, self._created_at, discard=True)
+            self._conn = None
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections.
+    - Pre-warmed via warm() so the first requests skip the TCP+TLS+auth handshake.
+    - Idle connections are pinged on checkout once idle longer than validate_idle.
+    - Connections older than max_lifetime are closed and replaced.
+    - Checkout waits at most 'timeout' seconds, then raises PoolExhaustedError.
+    """
+
+    def __init__(self, factory, size, timeout, max_lifetime, validate_idle):
+        self._factory = factory
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate_idle = validate_idle
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = collections.deque()    # (conn, created_at, returned_at)
+        self._open = 0                      # idle + in use + being created
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+            "created": 0,
+            "connect_failures": 0,
+            "recycled": 0,
+            "discarded": 0,
+        }
+
+    def _check_fork(self):
+        # Connections must never be shared across a fork (e.g. gunicorn --preload).
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _new_connection(self):
+        conn = self._factory()
+        with self._cond:
+            if conn is None:
+                self._open -= 1
+                self._stats["connect_failures"] += 1
+                self._cond.notify()
+            else:
+                self._stats["created"] += 1
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def warm(self, count):
+        """
+        Opens up to 'count' connections ahead of traffic, handshaking in parallel
+        so warm-up costs about one connect. Returns how many are idle.
+        """
+        with self._cond:
+            self._check_fork()
+            count = max(0, min(count, self.size - self._open))
+            self._open += count
+
+        def open_one():
+            conn = self._new_connection()
+            if conn is not None:
+                now = time.monotonic()
+                with self._cond:
+                    self._idle.append((conn, now, now))
+                    self._cond.notify()
+
+        openers = [threading.Thread(target=open_one, name="db-pool-warm", daemon=True) for _ in range(count)]
+        for opener in openers:
+            opener.start()
+        for opener in openers:
+            opener.join()
+        with self._cond:
+            return len(self._idle)
+
+    def acquire(self):
+        """
+        Returns a PooledConnection, or None if a new connection could not be opened.
+        Raises PoolExhaustedError if every connection stays busy for 'timeout' seconds.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    # LIFO: reuse the most recently returned (warmest) connection
+                    conn, created_at, returned_at = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolExhaustedError(
+                        f"No DB connection available within {self.timeout}s (pool size {self.size})."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            wait_ms = (time.monotonic() - start) * 1000.0
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time_total_ms"] += wait_ms
+            self._stats["wait_time_max_ms"] = max(self._stats["wait_time_max_ms"], wait_ms)
+
+        now = time.monotonic()
+        if conn is not None:
+            if now - created_at > self.max_lifetime:
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self._stats["recycled"] += 1
+            elif now - returned_at > self.validate_idle and not self._is_alive(conn):
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self._stats["discarded"] += 1
+
+        if conn is None:
+            conn = self._new_connection()
+            created_at = time.monotonic()
+            if conn is None:
+                with self._cond:
+                    self._in_use -= 1
+                return None
+
+        return PooledConnection(self, conn, created_at)
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def release(self, conn, created_at, discard=False):
+        """Returns a connection to the pool, ending any open transaction first."""
+        healthy = not discard
+        try:
+            # Only end a transaction / read snapshot that is actually open, so
+            # handlers that already committed do not pay an extra round trip.
+            if healthy and (getattr(conn, "in_transaction", True) or getattr(conn, "unread_result", False)):
+                conn.rollback()
+        except Exception:
+            healthy = False
+
+        expired = time.monotonic() - created_at > self.max_lifetime
+        if not healthy or expired:
+            self._close_quietly(conn)
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if healthy and not expired:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._open -= 1
+                self._stats["recycled" if expired else "discarded"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        """Snapshot of pool occupancy and checkout wait statistics."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+            })
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_time_avg_ms"] = round(snapshot["wait_time_total_ms"] / checkouts, 3) if checkouts else 0.0
+        snapshot["wait_time_total_ms"] = round(snapshot["wait_time_total_ms"], 3)
+        snapshot["wait_time_max_ms"] = round(snapshot["wait_time_max_ms"], 3)
+        return snapshot
+
+
+db_pool = ConnectionPool(
+    create_db_connection,
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    validate_idle=DB_POOL_VALIDATE_IDLE,
+)
+
+
+def get_db_connection():
+    """
+    Checks out a pooled MySQL connection (call .close() to return it).
+    Returns None if a new connection could not be established.
+    Raises PoolExhaustedError if the pool stays saturated past DB_POOL_TIMEOUT.
+    """
+    with stage_timer("db_acquire"):
+        return db_pool.acquire()
+
 def init_db():
-    """Simple check to ensure database connection is working."""
-    conn = get_db_connection()
-    if conn: 
-        print("Database connection successfully established and checked.")
-        conn.close()
+    """
+    Pre-warms the connection pool, which also checks that the database is reachable.
+    Runs on the background warm-up thread (see start_background_services), never
+    on the import path, so a slow database does not stall worker boot.
+    Returns None when DB_POOL_PREWARM=0, since the database was not contacted.
+    """
+    if DB_POOL_PREWARM <= 0:
+        startup_stats["db_warmup_seconds"] = 0.0
+        logger.info("Connection pool pre-warm disabled (DB_POOL_PREWARM=0); connections open on first use.")
+        return None
+    start = time.perf_counter()
+    warmed = db_pool.warm(DB_POOL_PREWARM)
+    startup_stats["db_warmup_seconds"] = time.perf_counter() - start
+    if warmed: 
+        logger.info("Database connection successfully established and checked (%d pooled connections warm in %.3fs).",
+                    warmed, startup_stats["db_warmup_seconds"])
     else:
-        print("Initial database connection failed. Check SSL config and credentials.")
+        logger.error("Initial database connection failed. Check SSL config and credentials.")
+    return warmed > 0
+
+
+# --- STARTUP TIMING & BACKGROUND DB HEALTH PROBE ---
+
+startup_stats = {
+    "import_seconds": None,          # Module import (app setup) time
+    "db_warmup_seconds": None,       # Background pool warm-up time
+    "first_request_seconds": None,   # Import start -> first request served
+}
+
+class DBHealthMonitor:
+    """
+    Keeps a cached DB status refreshed by a background probe every 'interval'
+    seconds, so /health can answer from memory instead of touching MySQL.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = {"db_status": "Unknown", "db_code": 1, "checked_at": None, "probe_ms": None}
+        self._thread = None
+
+    def _record(self, db_status, db_code, probe_ms):
+        with self._lock:
+            self._state = {
+                "db_status": db_status,
+                "db_code": db_code,
+                "checked_at": time.time(),
+                "probe_ms": round(probe_ms, 3),
+            }
+
+    def check(self):
+        """Live probe: checks out a pooled connection and pings the server."""
+        start = time.perf_counter()
+        try:
+            conn = get_db_connection()
+        except PoolExhaustedError:
+            # Every connection is busy serving traffic: reachable, but saturated.
+            self._record("Busy", 2, (time.perf_counter() - start) * 1000.0)
+            return self.snapshot()
+        online = False
+        if conn:
+            try:
+                online = conn.is_connected()
+            except Error:
+                online = False
+            finally:
+                conn.close()
+        self._record("Online" if online else "Offline", 0 if online else 1, (time.perf_counter() - start) * 1000.0)
+        return self.snapshot()
+
+    def snapshot(self):
+        with self._lock:
+            state = dict(self._state)
+        state["age_seconds"] = round(time.time() - state["checked_at"], 3) if state["checked_at"] else None
+        return state
+
+    def _warm_up_and_probe(self):
+        init_db()
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception("DB health probe failed: %s", e)
+            time.sleep(self.interval)
+
+    def start(self):
+        """Starts warm-up + periodic probing in the background (idempotent per process)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._warm_up_and_probe, name="db-warmup-health", daemon=True)
+        self._thread.start()
+
+
+db_health = DBHealthMonitor(HEALTH_PROBE_INTERVAL)
+
+
+# --- In-Process Caches ---
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL, bounded to 'max_size' entries.
+    max_size <= 0 disables the cache (every get() is a miss, put() is a no-op).
+    """
 
-init_db()
+    _MISSING = object()
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = collections.OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING:
+                self._stats["misses"] += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, self._MISSING) is not self._MISSING:
+                self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({"size": len(self._data), "max_size": self.max_size, "ttl": self.ttl})
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_ratio"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+
+class KeyedLocks:
+    """
+    Per-key mutexes so concurrent work on the SAME key (e.g. one invoice retried
+    in parallel) runs one at a time inside this worker, while other keys proceed.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, holders]
+        self._lock = threading.Lock()
+        self.waits = 0
+
+    @contextlib.contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        if not entry[0].acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+# invoice (REFERENCE) -> REQUEST_ID, so CPI retries are answered from memory
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CACHE_TTL)
+invoice_locks = KeyedLocks()
+
+# REQUEST_ID -> PAYMENT_REQUEST row for GET /transactions/<request_id> (read-through).
+# Rows written by THIS worker are invalidated immediately; rows changed elsewhere
+# (other workers / services) are at most TRANSACTION_CACHE_TTL seconds stale.
+transaction_cache = TTLCache(TRANSACTION_CACHE_SIZE, TRANSACTION_CACHE_TTL)
+transaction_ref_index = TTLCache(TRANSACTION_CACHE_SIZE, TRANSACTION_CACHE_TTL)  # REFERENCE -> REQUEST_ID
+TRANSACTION_NOT_FOUND = object()  # Negative-cache marker for unknown REQUEST_IDs
+
+def invalidate_transaction(request_id=None, reference=None):
+    """Drops a cached transaction after this service inserts or updates its row."""
+    if reference is not None:
+        request_id = transaction_ref_index.get(reference)
+        transaction_ref_index.invalidate(reference)
+    if request_id is not None:
+        transaction_cache.invalidate(request_id)
+
+def idempotency_stats():
+    stats = idempotency_cache.stats()
+    stats["inflight_waits"] = invoice_locks.waits
+    return stats
 
 
 # --- DATABASE LOGGING FUNCTION (UPDATED FOR FULL BANKING DETAILS) ---
 
+# Namespace for invoice-derived REQUEST_IDs (write-behind mode)
+PAYMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "mastercard_api/payment_request")
+
+def new_request_id(invoice):
+    """
+    REQUEST_ID for a new payment. With write-behind on it is a UUIDv5 of the
+    invoice, so an invoice always maps to the same ID no matter which worker
+    acknowledges it or how often it is retried; otherwise a random UUID.
+    A null invoice cannot be deduplicated, so it always gets a random UUID.
+    """
+    if WRITE_BEHIND_ENABLED and invoice is not None:
+        # Named by the REFERENCE text MySQL stores, so 123 and "123" share a row.
+        return str(uuid.uuid5(PAYMENT_ID_NAMESPACE, str(invoice)))
+    return str(uuid.uuid4())
+
+def idempotency_key(invoice):
+    """
+    Idempotency-cache / in-batch key for an invoice, or None when the payment
+    cannot be deduplicated: 'REFERENCE = NULL' never matches in MySQL, so every
+    null invoice is a new payment. JSON keeps 123 and "123" apart.
+    """
+    if invoice is None:
+        return None
+    return json.dumps(invoice, sort_keys=True, default=str)
+
+# SQL with NEW EXTENDED COLUMNS
+INSERT_PAYMENT_SQL = """
+INSERT INTO PAYMENT_REQUEST 
+(
+    REQUEST_ID, REFERENCE, VENDOR_ID, AMOUNT, CURRENCY, STATUS, 
+    RECEIVED_AT, LAST_UPDATED, CPI_RESPONSE,
+    PAYER_ACC_NO, PAYER_IFSC, VENDOR_IFSC, VENDOR_BANK_NAME, 
+    VENDOR_BRANCH, VENDOR_ACC_TYPE, VCC_CARD_NO, VCC_STATUS, PAYMENT_DUE_DATE
+) 
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+def build_payment_values(data, request_uuid, current_time):
+    """Maps JSON keys (from CPI) to the PAYMENT_REQUEST insert columns."""
+    return (
+        request_uuid,                       # 1. REQUEST_ID
+        data.get("invoice"),                # 2. REFERENCE (Mapped from InvoiceID)
+        data.get("vendorId"),               # 3. VENDOR_ID
+        str(data.get("amount")),            # 4. AMOUNT
+        data.get("currency"),               # 5. CURRENCY
+        "INITIATED",                        # 6. STATUS
+        current_time,                       # 7. RECEIVED_AT
+        current_time,                       # 8. LAST_UPDATED 
+        json.dumps(data),                   # 9. CPI_RESPONSE (Full JSON dump)
+        # --- NEW FIELDS ---
+        data.get("payerAcctNum"),           # 10. PAYER_ACC_NO
+        data.get("payerIFSC"),              # 11. PAYER_IFSC
+        data.get("vendorIFSC"),             # 12. VENDOR_IFSC
+        data.get("vendorBankName"),         # 13. VENDOR_BANK_NAME
+        data.get("vendorBranch"),           # 14. VENDOR_BRANCH
+        data.get("vendorBankAccountType"),  # 15. VENDOR_ACC_TYPE
+        data.get("vccCardNum"),             # 16. VCC_CARD_NO
+        data.get("vccStatus"),              # 17. VCC_STATUS
+        data.get("paymentDueDate")          # 18. PAYMENT_DUE_DATE
+    )
+
 def log_payment_request(data):
     """
     Logs the payment request with ALL banking details.
-    Implements IDEMPOTENCY: Checks if 'invoice' (reference) already exists.
+    Implements IDEMPOTENCY: Checks if 'invoice' (reference) already exists,
+    first in the in-process idempotency cache, then in the database.
+    Concurrent submissions of the same invoice in this worker are serialized,
+    so only one of them reaches the INSERT.
     """
+    reference = idempotency_key(data.get("invoice"))
+    if reference is None:
+        return _log_payment_request_db(data)
+    cached_id = idempotency_cache.get(reference)
+    if cached_id:
+        metrics.inc("payment_duplicates_total", (("source", "cache"),))
+        logger.info("Duplicate detected (cache): Payment for Invoice %s already processed.", data.get("invoice"))
+        return True, cached_id
+
+    with invoice_locks.hold(reference):
+        # Another thread may have stored this invoice while we waited
+        cached_id = idempotency_cache.get(reference)
+        if cached_id:
+            metrics.inc("payment_duplicates_total", (("source", "cache"),))
+            logger.info("Duplicate detected (cache): Payment for Invoice %s already processed.", data.get("invoice"))
+            return True, cached_id
+
+        log_success, request_uuid = _log_payment_request_db(data)
+        if log_success:
+            idempotency_cache.put(reference, request_uuid)
+        return log_success, request_uuid
+
+def _log_payment_request_db(data):
+    """Idempotency SELECT + INSERT against PAYMENT_REQUEST for one payload."""
     conn = get_db_connection()
     if not conn:
-        print("CRITICAL: Failed to get DB connection for logging.")
+        logger.critical("Failed to get DB connection for logging.")
         return False, None
-        
+
+    cursor = None
     try:
         cursor = conn.cursor(dictionary=True)
         
         # --- LOGIC 1: IDEMPOTENCY CHECK ---
         # Using 'invoice' as the unique reference key
         check_sql = "SELECT REQUEST_ID FROM PAYMENT_REQUEST WHERE REFERENCE = %s"
-        cursor.execute(check_sql, (data.get("invoice"),))
-        existing_record = cursor.fetchone()
+        with stage_timer("idempotency_select"):
+            cursor.execute(check_sql, (data.get("invoice"),))
+            existing_record = cursor.fetchone()
 
         if existing_record:
-            print(f"Duplicate detected: Payment for Invoice {data.get('invoice')} already processed.")
+            metrics.inc("payment_duplicates_total", (("source", "db"),))
+            logger.info("Duplicate detected: Payment for Invoice %s already processed.", data.get("invoice"))
             # Return the EXISTING ID so SAP gets a success response, but we don't duplicate.
             return True, existing_record['REQUEST_ID']
 
         # --- LOGIC 2: NEW PAYMENT INSERTION ---
-        request_uuid = str(uuid.uuid4())
+        request_uuid = new_request_id(data.get("invoice"))
         current_time = datetime.datetime.utcnow()
-        full_payload_json = json.dumps(data) 
-        
-        # SQL with NEW EXTENDED COLUMNS
-        sql = """
-        INSERT INTO PAYMENT_REQUEST 
-        (
-            REQUEST_ID, REFERENCE, VENDOR_ID, AMOUNT, CURRENCY, STATUS, 
-            RECEIVED_AT, LAST_UPDATED, CPI_RESPONSE,
-            PAYER_ACC_NO, PAYER_IFSC, VENDOR_IFSC, VENDOR_BANK_NAME, 
-            VENDOR_BRANCH, VENDOR_ACC_TYPE, VCC_CARD_NO, VCC_STATUS, PAYMENT_DUE_DATE
-        ) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        with stage_timer("payload_serialize"):
+            values = build_payment_values(data, request_uuid, current_time)
         
-        # Mapping JSON keys (from CPI) to DB Columns
-        values = (
-            request_uuid,                       # 1. REQUEST_ID
-            data.get("invoice"),                # 2. REFERENCE (Mapped from InvoiceID)
-            data.get("vendorId"),               # 3. VENDOR_ID
-            str(data.get("amount")),            # 4. AMOUNT
-            data.get("currency"),               # 5. CURRENCY
-            "INITIATED",                        # 6. STATUS
-            current_time,                       # 7. RECEIVED_AT
-            current_time,                       # 8. LAST_UPDATED 
-            full_payload_json,                  # 9. CPI_RESPONSE (Full JSON dump)
-            # --- NEW FIELDS ---
-            data.get("payerAcctNum"),           # 10. PAYER_ACC_NO
-            data.get("payerIFSC"),              # 11. PAYER_IFSC
-            data.get("vendorIFSC"),             # 12. VENDOR_IFSC
-            data.get("vendorBankName"),         # 13. VENDOR_BANK_NAME
-            data.get("vendorBranch"),           # 14. VENDOR_BRANCH
-            data.get("vendorBankAccountType"),  # 15. VENDOR_ACC_TYPE
-            data.get("vccCardNum"),             # 16. VCC_CARD_NO
-            data.get("vccStatus"),              # 17. VCC_STATUS
-            data.get("paymentDueDate")          # 18. PAYMENT_DUE_DATE
-        )
-        
-        cursor.execute(sql, values)
-        conn.commit()
-        print(f"Logged NEW payment request {request_uuid} to database.")
+        with stage_timer("insert"):
+            cursor.execute(INSERT_PAYMENT_SQL, values)
+        with stage_timer("commit"):
+            conn.commit()
+        invalidate_transaction(request_uuid)
+        logger.info("Logged NEW payment request %s to database.", request_uuid)
         return True, request_uuid
         
     except Error as e:
-        print(f"Database insertion failed: {e}")
+        count_db_error("log_payment")
+        logger.error("Database insertion failed: %s", e)
         conn.rollback()
         return False, None
         
     finally:
         if cursor: cursor.close()
         if conn: conn.close()
+
+def log_payment_batch(payloads, request_ids=None, received_times=None, use_cache=True, raise_errors=False):
+    """
+    Logs many validated payment requests in ONE transaction.
+    Per chunk of BATCH_CHUNK_SIZE: one 'REFERENCE IN (...)' idempotency lookup
+    and one multi-row executemany INSERT for the new invoices.
+    Optional 'request_ids' / 'received_times' (aligned with 'payloads') are used
+    for new rows instead of a fresh UUID / the current time (journal replay).
+    use_cache=False skips the idempotency cache lookup: journal replay must ask
+    the DB, because acknowledged-but-undrained invoices are already cached.
+    raise_errors=True re-raises the MySQL error after rollback, so the journal
+    drainer can tell a bad record from an unavailable database.
+    Returns (success, [(request_id, is_duplicate), ...]) aligned with 'payloads'.
+    """
+    conn = get_db_connection()
+    if not conn:
+        logger.critical("Failed to get DB connection for batch logging.")
+        return False, None
+
+    cursor = None
+    results = [None] * len(payloads)
+    seen_in_batch = {}  # invoice -> REQUEST_ID assigned earlier in this same batch
+    try:
+        cursor = conn.cursor(dictionary=True)
+        current_time = datetime.datetime.utcnow()
+
+        for start in range(0, len(payloads), BATCH_CHUNK_SIZE):
+            chunk = payloads[start:start + BATCH_CHUNK_SIZE]
+
+            # --- LOGIC 1: IDEMPOTENCY CHECK (cache, then one round trip per chunk) ---
+            existing = {}  # idempotency_key -> REQUEST_ID
+            lookup = {}    # REFERENCE text as stored -> keys in this chunk
+            for p in chunk:
+                reference = idempotency_key(p.get("invoice"))
+                if reference is None or reference in seen_in_batch or reference in existing:
+                    continue
+                cached_id = idempotency_cache.get(reference) if use_cache else None
+                if cached_id:
+                    existing[reference] = cached_id
+                else:
+                    lookup.setdefault(str(p.get("invoice")), set()).add(reference)
+            if lookup:
+                placeholders = ", ".join(["%s"] * len(lookup))
+                with stage_timer("batch_idempotency_select"):
+                    cursor.execute(
+                        f"SELECT REFERENCE, REQUEST_ID FROM PAYMENT_REQUEST WHERE REFERENCE IN ({placeholders})",
+                        list(lookup),
+                    )
+                    for row in cursor.fetchall():
+                        for reference in lookup.get(row["REFERENCE"], ()):
+                            existing[reference] = row["REQUEST_ID"]
+
+            # --- LOGIC 2: NEW PAYMENT INSERTION (multi-row) ---
+            rows = []
+            for offset, data in enumerate(chunk):
+                reference = idempotency_key(data.get("invoice"))
+                if reference in existing:
+                    results[start + offset] = (existing[reference], True)
+                elif reference in seen_in_batch:
+                    results[start + offset] = (seen_in_batch[reference], True)
+                else:
+                    request_uuid = request_ids[start + offset] if request_ids else new_request_id(data.get("invoice"))
+                    received_at = received_times[start + offset] if received_times else current_time
+                    if reference is not None:
+                        seen_in_batch[reference] = request_uuid
+                    rows.append(build_payment_values(data, request_uuid, received_at))
+                    results[start + offset] = (request_uuid, False)
+
+            if rows:
+                with stage_timer("batch_insert"):
+                    cursor.executemany(INSERT_PAYMENT_SQL, rows)
+
+        with stage_timer("commit"):
+            conn.commit()
+        for data, (request_uuid, duplicate) in zip(payloads, results):
+            reference = idempotency_key(data.get("invoice"))
+            if reference is not None:
+                idempotency_cache.put(reference, request_uuid)
+            if not duplicate:
+                invalidate_transaction(request_uuid)
+        inserted = sum(1 for _, duplicate in results if not duplicate)
+        metrics.inc("payment_duplicates_total", (("source", "batch"),), len(payloads) - inserted)
+        logger.info("Logged batch of %d payment requests (%d new, %d duplicates).", len(payloads), inserted, len(payloads) - inserted)
+        return True, results
+
+    except Error as e:
+        count_db_error("log_payment_batch")
+        logger.error("Batch database insertion failed: %s", e)
+        conn.rollback()
+        if raise_errors:
+            raise
+        return False, None
+
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+# --- WRITE-BEHIND JOURNAL (Optional: WRITE_BEHIND_ENABLED=1) ---
+# submit_payment appends the validated payload to a local fsync'd journal and
+# acknowledges immediately. One drainer per host (elected with a file lock, so
+# only one gunicorn worker drains at a time) replays the journal into
+# PAYMENT_REQUEST via log_payment_batch() using group commits, then advances a
+# checkpoint offset. Replays after a crash are safe: log_payment_batch() skips
+# invoices that already exist, so each invoice is stored exactly once.
+# A record the DB rejects for good (data too long, bad value, malformed JSON
+# fields) is isolated by bisecting its group and moved to a dead-letter file,
+# so one bad payment cannot wedge the drainer and back-pressure every submit.
+# While write-behind is on, every insert path uses new_request_id(), which is
+# derived from the invoice, so the acknowledged request_id is the stored one.
+# (Rows inserted BEFORE write-behind was enabled keep their random REQUEST_ID.)
+
+class JournalBackpressureError(Exception):
+    """Raised when the undrained journal exceeds JOURNAL_MAX_LAG_BYTES."""
+
+
+# Errors that retrying the same record can never fix.
+JOURNAL_PERMANENT_ERRORS = PERMANENT_DB_ERRORS + (KeyError, TypeError, ValueError)
+
+
+class PaymentJournal:
+    """Append-only, fsync'd NDJSON journal with a byte-offset checkpoint."""
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoint_path = path + ".offset"
+        self.lock_path = path + ".lock"
+        self.dead_letter_path = path + ".dead"
+        self._append_lock = threading.Lock()
+        self._drainer = None
+        self._stats = {"appended": 0, "drained": 0, "drain_batches": 0, "drain_failures": 0, "rejected": 0,
+                       "dead_lettered": 0}
+        with self._locked(self.path, "ab+") as fh:
+            self._repair_torn_tail(fh)
+
+    @contextlib.contextmanager
+    def _locked(self, path, mode):
+        """Opens 'path' holding an exclusive cross-process flock."""
+        with open(path, mode) as fh:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield fh
+            finally:
+                if fcntl:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def _repair_torn_tail(self, fh):
+        # A crash mid-append can leave a partial last line; drop it so the next
+        # append does not glue onto it. The request was never acknowledged.
+        # Scans back (in chunks, however long the torn record) to the last
+        # newline, but never below the checkpoint: drained records end there.
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        floor = self._read_checkpoint()
+        if floor > size:
+            floor = 0
+        position = size
+        while position > floor:
+            start = max(floor, position - 65536)
+            fh.seek(start)
+            cut = fh.read(position - start).rfind(b"\n")
+            if cut >= 0:
+                new_size = start + cut + 1
+                break
+            position = start
+        else:
+            new_size = floor
+        if new_size == size:
+            return
+        logger.warning("Journal: truncating torn tail (%d bytes) in %s.", size - new_size, fh.name)
+        fh.truncate(new_size)
+        os.fsync(fh.fileno())
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as fh:
+                return int(fh.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, offset):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(str(offset))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def lag_bytes(self):
+        """Bytes appended but not yet drained to MySQL."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        return max(0, size - self._read_checkpoint())
+
+    def append(self, record):
+        """Durably appends one record. Returns only after fsync."""
+        if self.lag_bytes() > JOURNAL_MAX_LAG_BYTES:
+            self._stats["rejected"] += 1
+            raise JournalBackpressureError(
+                f"Journal lag exceeds {JOURNAL_MAX_LAG_BYTES} bytes; DB writer is behind."
+            )
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with stage_timer("journal_append"), self._append_lock, self._locked(self.path, "ab") as fh:
+            fh.write(line)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._stats["appended"] += 1
+
+    def _read_group(self, offset):
+        """Reads up to JOURNAL_GROUP_SIZE complete records starting at 'offset'."""
+        records = []
+        with open(self.path, "rb") as fh:
+            fh.seek(offset)
+            while len(records) < JOURNAL_GROUP_SIZE:
+                line = fh.readline()
+                if not line.endswith(b"\n"):
+                    break  # EOF or an append still in progress
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.error("Journal: skipping undecodable record ending at offset %d.", offset)
+        return records, offset
+
+    def drain_once(self):
+        """
+        Writes one group of journaled records to MySQL in a single transaction.
+        Returns the number of records drained (0 when caught up or on failure).
+        """
+        offset = self._read_checkpoint()
+        if offset > os.path.getsize(self.path):
+            offset = 0  # Journal replaced or truncated behind our back
+        records, new_offset = self._read_group(offset)
+        if new_offset == offset:
+            self._compact(offset)
+            return 0
+
+        if records and not self._write_records(records):
+            self._stats["drain_failures"] += 1
+            return 0
+
+        self._write_checkpoint(new_offset)
+        self._stats["drained"] += len(records)
+        self._stats["drain_batches"] += 1
+        return len(records)
+
+    def _write_records(self, records):
+        """
+        Inserts 'records' in one transaction. On a permanent error the group is
+        bisected until the bad records are isolated and dead-lettered.
+        Returns False on a transient failure (the group is retried later).
+        """
+        try:
+            payloads = [r["payload"] for r in records]
+            request_ids = [r["request_id"] for r in records]
+            received_times = [datetime.datetime.fromisoformat(r["received_at"]) for r in records]
+            log_success, _ = log_payment_batch(payloads, request_ids, received_times,
+                                               use_cache=False, raise_errors=True)
+            return log_success
+        except JOURNAL_PERMANENT_ERRORS as e:
+            if len(records) == 1:
+                self._dead_letter(records[0], e)
+                return True
+        except Error:
+            return False
+        middle = len(records) // 2
+        # Already-inserted halves are skipped as duplicates if a later half fails.
+        return self._write_records(records[:middle]) and self._write_records(records[middle:])
+
+    def _dead_letter(self, record, error):
+        """Moves a record the DB will never accept to <journal>.dead for manual repair."""
+        entry = {"failed_at": datetime.datetime.utcnow().isoformat(), "error": repr(error), "record": record}
+        with open(self.dead_letter_path, "ab") as fh:
+            fh.write((json.dumps(entry, default=str) + "\n").encode("utf-8"))
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._stats["dead_lettered"] += 1
+        metrics.inc("journal_dead_letters_total")
+        logger.error("Journal: dead-lettered record %s to %s: %s",
+                     record.get("request_id") if isinstance(record, dict) else None, self.dead_letter_path, error)
+
+    def _compact(self, offset):
+        # Once fully drained, reset the journal so it does not grow forever.
+        if offset == 0 or offset < JOURNAL_COMPACT_BYTES:
+            return
+        with self._locked(self.path, "ab") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() != offset:
+                return  # New records arrived; compact later
+            # Checkpoint first: a crash before the truncate only replays drained
+            # (deduplicated) records, while a stale offset past new appends would skip them.
+            self._write_checkpoint(0)
+            fh.truncate(0)
+            os.fsync(fh.fileno())
+
+    def _drain_forever(self):
+        with open(self.lock_path, "a") as lock_fh:
+            if fcntl:
+                # Blocks until this worker becomes the (single) drainer.
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+            logger.info("Journal drainer active in worker %d (lag %d bytes).", os.getpid(), self.lag_bytes())
+            while True:
+                try:
+                    if self.drain_once():
+                        continue
+                except Exception as e:
+                    self._stats["drain_failures"] += 1
+                    logger.exception("Journal drain error: %s", e)
+                time.sleep(JOURNAL_DRAIN_INTERVAL)
+
+    def start_drainer(self):
+        """Starts the background drainer thread (idempotent per process)."""
+        if self._drainer and self._drainer.is_alive():
+            return
+        self._drainer = threading.Thread(target=self._drain_forever, name="journal-drainer", daemon=True)
+        self._drainer.start()
+
+    def stats(self):
+        snapshot = dict(self._stats)
+        snapshot["lag_bytes"] = self.lag_bytes()
+        return snapshot
+
+
+payment_journal = None
+if WRITE_BEHIND_ENABLED:
+    payment_journal = PaymentJournal(PAYMENT_JOURNAL_PATH)
+
+
+# --- SETTLEMENT INGESTION PIPELINE ---
+# receive_settlement_confirmation only enqueues. One consumer thread per worker
+# drains the bounded queue, coalesces updates per REFERENCE (last one wins) and
+# applies them as 'UPDATE ... WHERE REFERENCE IN (...)' statements, one per
+# distinct STATUS, in a single transaction per flush.
+
+class SettlementPipeline:
+    """Bounded settlement queue plus a batching consumer thread."""
+
+    def __init__(self, max_queue, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}  # reference -> (status, received_at); survives failed flushes
+        self._consumer = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "dropped": 0,
+            "rows_updated": 0,
+            "references_flushed": 0,
+            "flush_latency_last_ms": 0.0,
+            "flush_latency_max_ms": 0.0,
+            "flush_latency_total_ms": 0.0,
+        }
+
+    def enqueue(self, confirmations):
+        """Queues confirmations without blocking. Returns how many were accepted."""
+        received_at = datetime.datetime.utcnow()
+        queued = 0
+        for item in confirmations:
+            try:
+                self._queue.put_nowait((str(item["reference"]), str(item["status"]), received_at))
+            except queue.Full:
+                break
+            queued += 1
+        with self._lock:
+            self._stats["enqueued"] += queued
+            self._stats["rejected"] += len(confirmations) - queued
+        return queued
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _collect(self, wait=True):
+        """
+        Moves queued items into _pending until it holds batch_size references or
+        flush_interval passes. While failed flushes keep _pending full, nothing
+        is pulled, so the bounded queue fills up and enqueue() pushes back.
+        """
+        room = self.batch_size - len(self._pending)
+        if room <= 0:
+            return
+        try:
+            items = [self._queue.get(timeout=self.flush_interval) if wait else self._queue.get_nowait()]
+        except queue.Empty:
+            return
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < room:
+            remaining = deadline - time.monotonic()
+            if wait and remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining) if wait else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for reference, status, received_at in items:
+            if reference in self._pending:
+                with self._lock:
+                    self._stats["coalesced"] += 1
+            self._pending[reference] = (status, received_at)
+
+    def flush(self):
+        """
+        Applies all pending updates in one transaction. Returns True on success.
+        If the DB rejects a STATUS for good (e.g. too long for the column), each
+        STATUS group is retried on its own and the rejected groups are dropped,
+        so one bad confirmation cannot keep the whole queue from draining.
+        """
+        if not self._pending:
+            return True
+        # One statement per STATUS; LAST_UPDATED is the newest receipt time in the group.
+        by_status = collections.defaultdict(list)
+        last_updated = {}
+        for reference, (status, received_at) in self._pending.items():
+            by_status[status].append(reference)
+            last_updated[status] = max(received_at, last_updated.get(status, received_at))
+
+        start = time.monotonic()
+        try:
+            rows_updated = self._apply(by_status, last_updated)
+        except PERMANENT_DB_ERRORS:
+            rows_updated = 0
+            for status, references in by_status.items():
+                try:
+                    rows = self._apply({status: references}, last_updated)
+                except PERMANENT_DB_ERRORS as e:
+                    logger.error("Settlement: dropping %d confirmation(s) with rejected status %r: %s",
+                                 len(references), status, e)
+                    metrics.inc("settlement_dropped_total", value=len(references))
+                    with self._lock:
+                        self._stats["dropped"] += len(references)
+                    continue
+                except Error:
+                    rows = None
+                if rows is None:
+                    rows_updated = None
+                    break
+                rows_updated += rows
+        except Error:
+            rows_updated = None
+        if rows_updated is None:
+            with self._lock:
+                self._stats["flush_failures"] += 1
+            return False
+        for reference in self._pending:
+            invalidate_transaction(reference=reference)
+
+        latency_ms = (time.monotonic() - start) * 1000.0
+        metrics.observe("stage_duration_seconds", latency_ms / 1000.0, (("stage", "settlement_flush"),))
+        flushed = len(self._pending)
+        self._pending = {}
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["rows_updated"] += rows_updated
+            self._stats["references_flushed"] += flushed
+            self._stats["flush_latency_last_ms"] = latency_ms
+            self._stats["flush_latency_max_ms"] = max(self._stats["flush_latency_max_ms"], latency_ms)
+            self._stats["flush_latency_total_ms"] += latency_ms
+        logger.info("Settlement flush: %d reference(s), %d row(s) updated in %.1f ms.", flushed, rows_updated, latency_ms)
+        return True
+
+    def _apply(self, by_status, last_updated):
+        """
+        Runs the UPDATEs for 'by_status' in one transaction and returns the rows
+        updated, or None when no connection is available. Re-raises DB errors.
+        """
+        try:
+            conn = get_db_connection()
+        except PoolExhaustedError as e:
+            conn = None
+            logger.warning("Settlement flush deferred: %s", e)
+        if not conn:
+            return None
+
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            rows_updated = 0
+            for status, references in by_status.items():
+                for chunk_start in range(0, len(references), BATCH_CHUNK_SIZE):
+                    chunk = references[chunk_start:chunk_start + BATCH_CHUNK_SIZE]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(
+                        f"UPDATE PAYMENT_REQUEST SET STATUS = %s, LAST_UPDATED = %s WHERE REFERENCE IN ({placeholders})",
+                        [status, last_updated[status]] + chunk,
+                    )
+                    rows_updated += max(cursor.rowcount, 0)
+            conn.commit()
+            return rows_updated
+        except Error as e:
+            count_db_error("settlement_update")
+            logger.error("Settlement status update failed: %s", e)
+            conn.rollback()
+            raise
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def _consume_forever(self):
+        while not self._stopping.is_set():
+            try:
+                self._collect()
+                if not self.flush():
+                    self._stopping.wait(self.flush_interval)
+            except Exception as e:
+                logger.exception("Settlement consumer error: %s", e)
+                self._stopping.wait(self.flush_interval)
+        self._drain_remaining()
+
+    def _drain_remaining(self):
+        """Applies everything still pending or queued; gives up after repeated flush failures."""
+        failures = 0
+        while failures < SETTLEMENT_SHUTDOWN_RETRIES:
+            try:
+                self._collect(wait=False)
+                if not self._pending:
+                    break
+                if self.flush():
+                    continue
+            except Exception as e:
+                logger.exception("Settlement shutdown flush error: %s", e)
+            failures += 1
+            time.sleep(self.flush_interval)
+        dropped = len(self._pending) + self.depth()
+        if dropped:
+            logger.error("Settlement shutdown: %d acknowledged confirmation(s) could not be applied.", dropped)
+
+    def shutdown(self, timeout=None):
+        """
+        Stops the consumer and flushes pending + queued confirmations, so items
+        already ACKNOWLEDGED are not dropped on worker restart / deploy.
+        """
+        self._stopping.set()
+        if self._consumer and self._consumer.is_alive():
+            self._consumer.join(SETTLEMENT_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        elif self._pending or self.depth():
+            self._drain_remaining()
+
+    def start(self):
+        """Starts the consumer thread (idempotent per process)."""
+        if self._consumer and self._consumer.is_alive():
+            return
+        self._stopping.clear()
+        self._consumer = threading.Thread(target=self._consume_forever, name="settlement-consumer", daemon=True)
+        self._consumer.start()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self.depth()
+        snapshot["queue_capacity"] = self._queue.maxsize
+        snapshot["pending_references"] = len(self._pending)
+        flushes = snapshot["flushes"]
+        snapshot["flush_latency_avg_ms"] = round(snapshot["flush_latency_total_ms"] / flushes, 3) if flushes else 0.0
+        for key in ("flush_latency_last_ms", "flush_latency_max_ms", "flush_latency_total_ms"):
+            snapshot[key] = round(snapshot[key], 3)
+        return snapshot
+
+
+settlement_pipeline = SettlementPipeline(SETTLEMENT_QUEUE_SIZE, SETTLEMENT_BATCH_SIZE, SETTLEMENT_FLUSH_INTERVAL)
+# gunicorn workers leave via sys.exit(), so atexit runs on graceful shutdown.
+atexit.register(settlement_pipeline.shutdown)
 # ----------------------------------------
 
 
-# --- CORE ENDPOINT: Payment Submission ---
+# --- PAYLOAD VALIDATION (Shared by single and batch submission) ---
 
-@app.post("/mastercard/submit_payment")
-def submit_payment_request():
+# Define required fields (Updated to match new CPI Mapping)
+# We now check 'vendorId' instead of the old 'vendorld'
+REQUIRED_PAYMENT_FIELDS = ["vendorId", "invoice", "amount", "currency"]
+
+def validate_payment_payload(data):
     """
-    1. Receives payment request from CPI.
-    2. Validates essential data.
-    3. Logs request to Aiven DB (Handling Duplicates).
-    4. Returns Success to CPI.
+    Returns None if the payload is valid, otherwise an (error_body, http_code) tuple.
     """
-    data = request.json
-    
-    # Define required fields (Updated to match new CPI Mapping)
-    # We now check 'vendorId' instead of the old 'vendorld'
-    required_fields = ["vendorId", "invoice", "amount", "currency"] 
-    
+    if not isinstance(data, dict):
+        metrics.inc("validation_failures_total", (("reason", "not_an_object"),))
+        return {"status": "ERROR", "message": "Payment payload must be a JSON object."}, 400
+
     # 1. Check Required Fields
     # Only strictly failing if critical keys are missing.
-    missing_fields = [field for field in required_fields if field not in data]
+    missing_fields = [field for field in REQUIRED_PAYMENT_FIELDS if field not in data]
     if missing_fields:
-        return jsonify({
+        metrics.inc("validation_failures_total", (("reason", "missing_fields"),))
+        return {
             "status": "ERROR", 
             "message": f"Missing required payment fields: {', '.join(missing_fields)}"
-        }), 400
+        }, 400
 
     # 2. Validation Logic
     try:
         amount = float(data["amount"])
         if amount <= 0:
-            return jsonify({"status": "FAILED", "message": "Validation Error: Amount must be positive."}), 400
+            metrics.inc("validation_failures_total", (("reason", "amount_not_positive"),))
+            return {"status": "FAILED", "message": "Validation Error: Amount must be positive."}, 400
     except (TypeError, ValueError):
-        return jsonify({"status": "FAILED", "message": "Validation Error: Amount field is invalid or missing."}), 400
+        metrics.inc("validation_failures_total", (("reason", "amount_invalid"),))
+        return {"status": "FAILED", "message": "Validation Error: Amount field is invalid or missing."}, 400
+
+    return None
+
+
+# --- CORE ENDPOINT: Payment Submission ---
+
+@app.post("/mastercard/submit_payment")
+def submit_payment_request():
+    """
+    1. Receives payment request from CPI.
+    2. Validates essential data.
+    3. Logs request to Aiven DB (Handling Duplicates).
+    4. Returns Success to CPI.
+    """
+    with stage_timer("json_parse"):
+        data = request.json
+    
+    # 1 & 2. Required fields + validation logic
+    validation_error = validate_payment_payload(data)
+    if validation_error:
+        body, code = validation_error
+        return jsonify(body), code
+
+    # 3a. Write-behind mode: journal locally and acknowledge without waiting on MySQL
+    if payment_journal:
+        return journal_payment_request(data)
 
     # 3. Log the request to Aiven MySQL (With Idempotency Check)
     log_success, request_uuid = log_payment_request(data)
@@ -173,19 +1642,8 @@ def submit_payment_request():
     # 4. Return Success Response to CPI
     
     if log_success:
-        print(f"Validation successful for invoice: {data.get('invoice')}. Payment Stored.")
-        
-        # Simulate a Mastercard VCC Number generation
-        mock_vcc_number = "5500" + str(uuid.uuid4().int)[:12] 
-
-        return jsonify({
-            "status": "ACCEPTED",
-            "reference": data.get("invoice"),
-            "request_id": request_uuid,
-            "message": "Payment request received and stored successfully.",
-            "mastercard_vcc_number": mock_vcc_number,
-            "mastercard_status": "PROCESSING"
-        }), 202 # Accepted status
+        logger.info("Validation successful for invoice: %s. Payment Stored.", data.get("invoice"))
+        return accepted_payment_response(data, request_uuid, "Payment request received and stored successfully.")
 
     else:
         return jsonify({
@@ -194,64 +1652,611 @@ def submit_payment_request():
         }), 500
 
 
+def accepted_payment_response(data, request_uuid, message):
+    """The 202 ACCEPTED body returned to CPI for a stored, journaled or duplicate payment."""
+    # Simulate a Mastercard VCC Number generation
+    mock_vcc_number = "5500" + str(uuid.uuid4().int)[:12]
+
+    return jsonify({
+        "status": "ACCEPTED",
+        "reference": data.get("invoice"),
+        "request_id": request_uuid,
+        "message": message,
+        "mastercard_vcc_number": mock_vcc_number,
+        "mastercard_status": "PROCESSING"
+    }), 202 # Accepted status
+
+
+def journal_payment_request(data):
+    """
+    Write-behind variant of steps 3-4: fsync to the journal, then acknowledge.
+    The request_id is derived from the invoice (new_request_id), so every retry,
+    on any worker and after any restart, is told the REQUEST_ID that is stored.
+    """
+    reference = idempotency_key(data.get("invoice"))
+    cached_response = _journal_duplicate_response(data, reference)
+    if cached_response:
+        return cached_response
+
+    # Concurrent retries of the same invoice in this worker journal it only once.
+    with invoice_locks.hold(reference) if reference is not None else contextlib.nullcontext():
+        cached_response = _journal_duplicate_response(data, reference)
+        if cached_response:
+            return cached_response
+
+        request_uuid = new_request_id(data.get("invoice"))
+        try:
+            payment_journal.append({
+                "request_id": request_uuid,
+                "received_at": datetime.datetime.utcnow().isoformat(),
+                "payload": data,
+            })
+        except JournalBackpressureError as e:
+            metrics.inc("journal_backpressure_total")
+            logger.warning("Journal backpressure for invoice %s: %s", data.get("invoice"), e)
+            return jsonify({
+                "status": "FAILED",
+                "message": "Service busy: payment journal is backlogged, retry later."
+            }), 503, {"Retry-After": str(JOURNAL_RETRY_AFTER)}
+        except OSError as e:
+            logger.error("Journal append failed: %s", e)
+            return jsonify({
+                "status": "FAILED",
+                "message": "Journal Error: Could not store payment request."
+            }), 500
+
+        # Retries of this invoice are now answered without re-journaling
+        if reference is not None:
+            idempotency_cache.put(reference, request_uuid)
+
+    logger.info("Validation successful for invoice: %s. Payment Journaled.", data.get("invoice"))
+    return accepted_payment_response(data, request_uuid, "Payment request received and journaled successfully.")
+
+def _journal_duplicate_response(data, reference):
+    """202 for an invoice this worker already journaled or stored, else None."""
+    request_uuid = idempotency_cache.get(reference) if reference is not None else None
+    if not request_uuid:
+        return None
+    metrics.inc("payment_duplicates_total", (("source", "cache"),))
+    logger.info("Duplicate detected (cache): Payment for Invoice %s already processed.", data.get("invoice"))
+    # The invoice may still be waiting in the journal, so do not claim it is stored.
+    return accepted_payment_response(data, request_uuid, "Payment request already received; returning the original request_id.")
+
+
+# --- CORE ENDPOINT: Batch Payment Submission ---
+
+def parse_batch_body(list_key="payments", allow_single=False):
+    """
+    Reads the batch body: a JSON array, {"<list_key>": [...]}, or NDJSON
+    (one payload per line, Content-Type application/x-ndjson).
+    With allow_single, a plain JSON object is treated as a batch of one.
+    Returns (payloads, error_message).
+    """
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        payloads = []
+        for line_no, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                payloads.append(json.loads(line))
+            except ValueError:
+                return None, f"Invalid JSON on NDJSON line {line_no}."
+        return payloads, None
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = [data] if allow_single and list_key not in data else data.get(list_key)
+    if not isinstance(data, list):
+        return None, f"Batch body must be a JSON array, {{\"{list_key}\": [...]}}, or NDJSON."
+    return data, None
+
+@app.post("/mastercard/submit_payments_batch")
+def submit_payments_batch():
+    """
+    1. Receives a payment run (many payloads) from CPI.
+    2. Validates each item with the same rules as submit_payment.
+    3. Logs all valid items in one transaction (chunked lookups + bulk INSERT).
+    4. Returns a per-item status list.
+    """
+    payloads, parse_error = parse_batch_body()
+    if parse_error:
+        return jsonify({"status": "ERROR", "message": parse_error}), 400
+    if not payloads:
+        return jsonify({"status": "ERROR", "message": "Batch contains no payment requests."}), 400
+    if len(payloads) > BATCH_MAX_ITEMS:
+        return jsonify({
+            "status": "ERROR",
+            "message": f"Batch too large: {len(payloads)} items (max {BATCH_MAX_ITEMS})."
+        }), 413
+
+    items = [None] * len(payloads)
+    valid_indexes = []
+    for index, data in enumerate(payloads):
+        validation_error = validate_payment_payload(data)
+        if validation_error:
+            body, _ = validation_error
+            items[index] = {
+                "index": index,
+                "reference": data.get("invoice") if isinstance(data, dict) else None,
+                "status": body["status"],
+                "message": body["message"],
+            }
+        else:
+            valid_indexes.append(index)
+
+    if valid_indexes:
+        log_success, results = log_payment_batch([payloads[i] for i in valid_indexes])
+        if not log_success:
+            return jsonify({
+                "status": "FAILED",
+                "message": "Database Error: Could not store payment batch."
+            }), 500
+
+        for index, (request_uuid, duplicate) in zip(valid_indexes, results):
+            items[index] = {
+                "index": index,
+                "reference": payloads[index].get("invoice"),
+                "status": "DUPLICATE" if duplicate else "ACCEPTED",
+                "request_id": request_uuid,
+                "mastercard_status": "PROCESSING",
+            }
+
+    accepted = sum(1 for item in items if item["status"] in ("ACCEPTED", "DUPLICATE"))
+    return jsonify({
+        "status": "ACCEPTED" if accepted == len(items) else ("PARTIAL" if accepted else "FAILED"),
+        "total": len(items),
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "items": items,
+    }), 202 if accepted else 400
+
+
 # --- INBOUND ENDPOINT: Settlement Confirmation ---
 
+def valid_settlement_status(status):
+    """A non-empty string that fits the STATUS column (and the allowed set, if configured)."""
+    if not isinstance(status, str) or not status.strip() or len(status) > SETTLEMENT_STATUS_MAX_LENGTH:
+        return False
+    return not SETTLEMENT_ALLOWED_STATUSES or status in SETTLEMENT_ALLOWED_STATUSES
+
 @app.post("/mastercard/receive_settlement_confirmation")
 def receive_settlement_confirmation():
     """
-    Placeholder for the Inbound flow (Automated Reconciliation).
+    Inbound flow (Automated Reconciliation).
+    Accepts one confirmation, a JSON array / {"settlements": [...]}, or NDJSON,
+    and puts each item on the settlement queue. STATUS updates are applied
+    asynchronously in batches by the settlement consumer.
     """
-    data = request.json
-    print(f"Received settlement confirmation for Ref: {data.get('reference')}. Status: {data.get('status')}")
+    confirmations, parse_error = parse_batch_body(list_key="settlements", allow_single=True)
+    if parse_error:
+        return jsonify({"status": "ERROR", "message": parse_error}), 400
+
+    invalid = [
+        index for index, item in enumerate(confirmations)
+        if not isinstance(item, dict) or not item.get("reference") or not valid_settlement_status(item.get("status"))
+    ]
+    if invalid:
+        allowed = f" (one of: {', '.join(sorted(SETTLEMENT_ALLOWED_STATUSES))})" if SETTLEMENT_ALLOWED_STATUSES else ""
+        return jsonify({
+            "status": "ERROR",
+            "message": f"Settlement confirmations missing 'reference' or with invalid 'status'{allowed} at index: {', '.join(map(str, invalid[:20]))}"
+        }), 400
+
+    queued = settlement_pipeline.enqueue(confirmations)
+    if queued < len(confirmations):
+        # Status updates are idempotent (last one wins), so resending the whole batch is safe.
+        return jsonify({
+            "status": "FAILED",
+            "queued": queued,
+            "message": "Service busy: settlement queue is full, retry later."
+        }), 503, {"Retry-After": "1"}
+
+    logger.info("Received %d settlement confirmation(s); queue depth %d.", queued, settlement_pipeline.depth())
     return jsonify({
         "status": "ACKNOWLEDGED", 
+        "queued": queued,
         "message": "Settlement confirmation received and successfully queued."
     }), 200
 
 
+# --- REQUEST INSTRUMENTATION ---
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if _services_pid != os.getpid():
+        # Forked after import (e.g. gunicorn --preload): threads do not survive fork.
+        start_background_services()
+    if startup_stats["first_request_seconds"] is None:
+        startup_stats["first_request_seconds"] = g.request_start - _IMPORT_STARTED
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-endpoint latency histogram + status counter, and the sampled slow-request log."""
+    start = g.get("request_start")
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    # Route templates (not raw paths) keep label cardinality bounded.
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("http_request_duration_seconds", elapsed, (("endpoint", endpoint), ("method", request.method)))
+    metrics.inc("http_requests_total", (("endpoint", endpoint), ("method", request.method), ("code", str(response.status_code))))
+
+    if elapsed * 1000.0 >= SLOW_REQUEST_MS and SLOW_REQUEST_SAMPLE_RATE > 0 and random.random() < SLOW_REQUEST_SAMPLE_RATE:
+        stages = ", ".join(f"{stage}={seconds * 1000.0:.1f}ms" for stage, seconds in g.get("stage_timings", []))
+        logger.warning("Slow request: %s %s -> %d in %.1f ms [%s]",
+                       request.method, request.path, response.status_code, elapsed * 1000.0, stages)
+    return response
+
+def collect_runtime_counters():
+    """Cumulative per-worker pool and cache totals, exported as counters."""
+    pool = db_pool.stats()
+    counters = [
+        ("db_pool_checkouts_total", (), pool["checkouts"]),
+        ("db_pool_timeouts_total", (), pool["timeouts"]),
+        ("db_pool_wait_seconds_total", (), pool["wait_time_total_ms"] / 1000.0),
+    ]
+    for cache_name, stats in (("idempotency", idempotency_cache.stats()), ("transaction", transaction_cache.stats())):
+        for key in ("hits", "misses", "evictions"):
+            counters.append((f"cache_{key}_total", (("cache", cache_name),), stats[key]))
+    return counters
+
+def collect_runtime_gauges():
+    """Point-in-time per-worker gauges published with each metrics snapshot."""
+    pool = db_pool.stats()
+    gauges = [
+        ("db_pool_in_use", (), pool["in_use"]),
+        ("db_pool_idle", (), pool["idle"]),
+        ("db_pool_open", (), pool["open"]),
+        ("settlement_queue_depth", (), settlement_pipeline.depth()),
+        ("db_up", (), 1 if db_health.snapshot()["db_code"] == 0 else 0),
+    ]
+    for key, seconds in startup_stats.items():
+        if seconds is not None:
+            gauges.append((f"startup_{key}", (), seconds))
+    for cache_name, stats in (("idempotency", idempotency_cache.stats()), ("transaction", transaction_cache.stats())):
+        gauges.append(("cache_size", (("cache", cache_name),), stats["size"]))
+    if payment_journal:
+        gauges.append(("journal_lag_bytes", (), payment_journal.lag_bytes()))
+    return gauges
+
+metrics.register_counters(collect_runtime_counters)
+metrics.register_gauges(collect_runtime_gauges)
+
+
+# --- BACKGROUND SERVICES ---
+
+_services_pid = None
+
+def start_background_services():
+    """
+    Starts per-worker threads without blocking: DB warm-up + health probe,
+    settlement consumer, journal drainer and metrics flusher.
+    """
+    global _services_pid
+    _services_pid = os.getpid()
+    db_health.start()
+    settlement_pipeline.start()
+    if payment_journal:
+        payment_journal.start_drainer()
+    metrics.start_flusher()
+
+
 # --- MANAGEMENT/CRUD ENDPOINTS (For Testing/Monitoring) ---
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition, aggregated across all gunicorn workers via METRICS_DIR."""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.errorhandler(PoolExhaustedError)
+def handle_pool_exhausted(e):
+    """Fail fast with 503 when every pooled DB connection is busy."""
+    metrics.inc("db_pool_exhausted_total")
+    logger.warning("DB pool exhausted: %s", e)
+    return jsonify({"status": "FAILED", "message": "Service busy: no database connection available."}), 503, {"Retry-After": "1"}
+
+@app.get("/pool_stats")
+def pool_stats():
+    """Connection pool, cache, settlement queue, startup (and write-behind journal) statistics for this worker."""
+    stats = {
+        "pid": os.getpid(),
+        "pool": db_pool.stats(),
+        "idempotency_cache": idempotency_stats(),
+        "transaction_cache": transaction_cache.stats(),
+        "startup": startup_stats,
+        "db_health": db_health.snapshot(),
+    }
+    stats["settlement"] = settlement_pipeline.stats()
+    if payment_journal:
+        stats["journal"] = payment_journal.stats()
+    return jsonify(stats), 200
+
 @app.get("/health")
 def health_check():
-    """Simple health check endpoint."""
-    conn = get_db_connection()
-    if conn:
-        conn.close()
-        db_status = "Online"
-        db_code = 0
-    else:
-        db_status = "Offline"
-        db_code = 1
+    """
+    Cheap health check answered from the cached background probe.
+    '?deep=1' runs a live DB check instead (and refreshes the cache).
+    """
+    deep = request.args.get("deep", "").lower() in ("1", "true", "yes")
+    db_state = db_health.check() if deep else db_health.snapshot()
 
     return jsonify({
         "status": "OK",
         "service": "Mastercard API Wrapper",
-        "db_status": db_status,
-        "db_code": db_code
+        "db_status": db_state["db_status"],
+        "db_code": db_state["db_code"],
+        "db_checked_age_seconds": db_state["age_seconds"],
+        "deep": deep
     }), 200
 
 @app.get("/transactions/<string:request_id>")
 def get_transaction_details(request_id):
-    """Retrieves a single transaction log from PAYMENT_REQUEST."""
+    """
+    Retrieves a single transaction log from PAYMENT_REQUEST (read-through cached).
+    Responses carry ETag / Last-Modified from LAST_UPDATED, so pollers sending
+    If-None-Match / If-Modified-Since get 304 Not Modified.
+    """
+    transaction = transaction_cache.get(request_id)
+    if transaction is None:
+        transaction = load_transaction(request_id)
+        if isinstance(transaction, tuple):
+            return transaction  # DB error response
+
+    if transaction is TRANSACTION_NOT_FOUND:
+        return jsonify({"message": "Transaction request not found"}), 404
+
+    response = jsonify(transaction)
+    last_updated = transaction.get("LAST_UPDATED")
+    if last_updated:
+        last_updated = last_updated.replace(tzinfo=datetime.timezone.utc)  # Stored as naive UTC
+        response.set_etag(f"{request_id}-{last_updated.timestamp():.6f}", weak=True)
+        response.last_modified = last_updated
+    return response.make_conditional(request)
+
+def load_transaction(request_id):
+    """Reads one row from MySQL and caches it (or a short-lived negative entry)."""
     conn = get_db_connection()
     if not conn: return jsonify({"message": "DB connection failed"}), 503
     
+    cur = None
     try:
         cur = conn.cursor(dictionary=True)
         # Select ALL columns to verify full data insertion
-        cur.execute("SELECT * FROM PAYMENT_REQUEST WHERE REQUEST_ID = %s", (request_id,))
-        transaction = cur.fetchone()
-        
-        if transaction:
-            return jsonify(transaction), 200
-        else:
-            return jsonify({"message": "Transaction request not found"}), 404
+        with stage_timer("transaction_select"):
+            cur.execute("SELECT * FROM PAYMENT_REQUEST WHERE REQUEST_ID = %s", (request_id,))
+            transaction = cur.fetchone()
     except Error as e:
+        count_db_error("transaction_select")
         return jsonify({"message": str(e)}), 500
     finally:
         if cur: cur.close()
         if conn: conn.close()
 
+    if transaction:
+        transaction_cache.put(request_id, transaction)
+        if transaction.get("REFERENCE") is not None:
+            transaction_ref_index.put(str(transaction["REFERENCE"]), request_id)
+        return transaction
+
+    transaction_cache.put(request_id, TRANSACTION_NOT_FOUND, ttl=TRANSACTION_NEGATIVE_TTL)
+    return TRANSACTION_NOT_FOUND
+
+
+# --- TRANSACTION QUERY & RECONCILIATION EXPORT ---
+# Keyset pagination on (RECEIVED_AT, REQUEST_ID): each page continues strictly
+# after the last row of the previous one, so deep pages cost the same as the
+# first (no OFFSET scans). Exports stream rows from an unbuffered cursor.
+
+TRANSACTION_COLUMNS = [
+    "REQUEST_ID", "REFERENCE", "VENDOR_ID", "AMOUNT", "CURRENCY", "STATUS",
+    "RECEIVED_AT", "LAST_UPDATED", "CPI_RESPONSE",
+    "PAYER_ACC_NO", "PAYER_IFSC", "VENDOR_IFSC", "VENDOR_BANK_NAME",
+    "VENDOR_BRANCH", "VENDOR_ACC_TYPE", "VCC_CARD_NO", "VCC_STATUS", "PAYMENT_DUE_DATE",
+]
+
+def encode_page_cursor(row):
+    """Opaque 'after' token pointing at the given (last returned) row."""
+    key = json.dumps([row["RECEIVED_AT"].isoformat(), row["REQUEST_ID"]])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+def decode_page_cursor(token):
+    try:
+        received_at, request_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return datetime.datetime.fromisoformat(received_at), request_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid 'after' cursor.")
+
+def parse_timestamp_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}': expected ISO-8601 timestamp.")
+
+def build_transaction_query(args):
+    """
+    Translates query-string filters into (sql, params, columns).
+    Filters: status (comma-separated), vendor_id, received_from (inclusive),
+    received_to (exclusive), after (keyset cursor). 'fields' projects columns,
+    e.g. to skip the large CPI_RESPONSE blob. Raises ValueError on bad input.
+    """
+    columns = TRANSACTION_COLUMNS
+    if args.get("fields"):
+        columns = [c.strip().upper() for c in args["fields"].split(",") if c.strip()]
+        unknown = [c for c in columns if c not in TRANSACTION_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # The keyset columns are always selected so the next cursor can be built.
+    select_columns = columns + [c for c in ("RECEIVED_AT", "REQUEST_ID") if c not in columns]
+
+    where, params = [], []
+    if args.get("status"):
+        statuses = [v.strip() for v in args["status"].split(",") if v.strip()]
+        if not statuses:
+            raise ValueError("'status' must list at least one value.")
+        where.append(f"STATUS IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    if args.get("vendor_id"):
+        where.append("VENDOR_ID = %s")
+        params.append(args["vendor_id"])
+    received_from = parse_timestamp_arg(args, "received_from")
+    if received_from:
+        where.append("RECEIVED_AT >= %s")
+        params.append(received_from)
+    received_to = parse_timestamp_arg(args, "received_to")
+    if received_to:
+        where.append("RECEIVED_AT < %s")
+        params.append(received_to)
+    if args.get("after"):
+        after_received_at, after_request_id = decode_page_cursor(args["after"])
+        # Row constructor lets MySQL range-scan the (RECEIVED_AT, REQUEST_ID) index.
+        where.append("(RECEIVED_AT, REQUEST_ID) > (%s, %s)")
+        params.extend([after_received_at, after_request_id])
+
+    sql = f"SELECT {', '.join(select_columns)} FROM PAYMENT_REQUEST"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY RECEIVED_AT, REQUEST_ID"
+    return sql, params, columns
+
+def json_default(value):
+    """JSON encoder for DB values (datetime/date/Decimal)."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+@app.get("/transactions")
+def list_transactions():
+    """One keyset-paginated page of transactions; follow 'next_cursor' via ?after=."""
+    try:
+        sql, params, columns = build_transaction_query(request.args)
+        limit = int(request.args.get("limit", TRANSACTIONS_PAGE_SIZE))
+        if not 1 <= limit <= TRANSACTIONS_MAX_PAGE_SIZE:
+            raise ValueError(f"'limit' must be between 1 and {TRANSACTIONS_MAX_PAGE_SIZE}.")
+    except ValueError as e:
+        return jsonify({"status": "ERROR", "message": str(e)}), 400
+
+    conn = get_db_connection()
+    if not conn: return jsonify({"message": "DB connection failed"}), 503
+
+    cur = None
+    try:
+        cur = conn.cursor(dictionary=True)
+        # One extra row tells us whether another page exists.
+        with stage_timer("transaction_page_select"):
+            cur.execute(sql + " LIMIT %s", params + [limit + 1])
+            rows = cur.fetchall()
+    except Error as e:
+        count_db_error("transaction_list")
+        return jsonify({"message": str(e)}), 500
+    finally:
+        if cur: cur.close()
+        if conn: conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        "count": len(rows),
+        "has_more": has_more,
+        "next_cursor": encode_page_cursor(rows[-1]) if has_more else None,
+        "transactions": [{c: row[c] for c in columns} for row in rows],
+    }), 200
+
+# Exports hold a connection for the whole stream, so they never borrow from db_pool.
+export_slots = threading.BoundedSemaphore(max(1, EXPORT_MAX_CONCURRENT))
+
+@app.get("/transactions/export")
+def export_transactions():
+    """
+    Streams every matching transaction as NDJSON (default) or CSV (?format=csv).
+    Rows are read from an unbuffered server-side cursor in EXPORT_FETCH_SIZE
+    chunks and yielded as they arrive, so memory stays flat for any result size.
+    Each export uses a dedicated (non-pooled) connection, and at most
+    EXPORT_MAX_CONCURRENT run per worker; extra requests get 503.
+    """
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"status": "ERROR", "message": "'format' must be 'ndjson' or 'csv'."}), 400
+    try:
+        sql, params, columns = build_transaction_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "ERROR", "message": str(e)}), 400
+
+    if not export_slots.acquire(blocking=False):
+        return jsonify({"message": "Too many exports in progress, retry later."}), 503
+    conn = create_db_connection()
+    if not conn:
+        export_slots.release()
+        return jsonify({"message": "DB connection failed"}), 503
+
+    cur = None
+    finished = False
+
+    def finish():
+        # Runs once, from the generator or from response close if it never started.
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        for resource in (cur, conn):
+            try:
+                if resource: resource.close()
+            except Exception:
+                pass    # unread rows after an aborted stream; the socket is dropped anyway
+        export_slots.release()
+
+    try:
+        cur = conn.cursor(dictionary=True, buffered=False)
+        cur.execute(sql, params)
+    except Error as e:
+        count_db_error("transaction_export")
+        finish()
+        return jsonify({"message": str(e)}), 500
+
+    def generate():
+        try:
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+            while True:
+                rows = cur.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                if export_format == "csv":
+                    for row in rows:
+                        writer.writerow([json_default(row[c]) if row[c] is not None else "" for c in columns])
+                    chunk = buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                else:
+                    chunk = "".join(json.dumps({c: row[c] for c in columns}, default=json_default) + "\n" for row in rows)
+                yield chunk
+            if export_format == "csv" and buffer.tell():
+                yield buffer.getvalue()
+        except Error as e:
+            count_db_error("transaction_export")
+            logger.error("Transaction export aborted: %s", e)
+            # Re-raise so the server aborts the chunked response: ending it
+            # normally would hand the client a truncated but well-formed file.
+            raise
+        finally:
+            finish()
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = Response(generate(), mimetype=mimetype)
+    response.call_on_close(finish)
+    response.headers["Content-Disposition"] = f"attachment; filename=transactions.{export_format}"
+    return response
+
+
+start_background_services()
+startup_stats["import_seconds"] = time.perf_counter() - _IMPORT_STARTED
+logger.info("Worker %d ready in %.3fs (DB warm-up continues in background).", os.getpid(), startup_stats["import_seconds"])
+
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=os.environ.get('PORT', 5000), debug=True)
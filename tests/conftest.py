@@ -0,0 +1,23 @@
+"""
+Test setup shared by the whole suite: the app reads its configuration at import,
+so the environment and the fake_mysql stand-in are installed here, once,
+before any test module imports mastercard_api_app.
+"""
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+os.environ.update(
+    WRITE_BEHIND_ENABLED="1",
+    PAYMENT_JOURNAL_PATH=os.path.join(tempfile.mkdtemp(prefix="journal_test_"), "payment_journal.jsonl"),
+    JOURNAL_DRAIN_INTERVAL="0.05",
+    SETTLEMENT_FLUSH_INTERVAL="0.05",
+    METRICS_DIR="",
+)
+
+from benchmarks import fake_mysql  # noqa: E402
+
+fake_mysql.install()
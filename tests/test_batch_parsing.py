@@ -0,0 +1,16 @@
+"""Batch body parsing shared by submit_payments_batch and settlement confirmations."""
+import mastercard_api_app
+
+
+def test_batch_object_without_payments_key_is_rejected_with_400():
+    client = mastercard_api_app.app.test_client()
+    response = client.post("/mastercard/submit_payments_batch", json={"invoice": "X"})
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "ERROR"
+
+
+def test_single_settlement_object_is_accepted():
+    client = mastercard_api_app.app.test_client()
+    response = client.post("/mastercard/receive_settlement_confirmation", json={"reference": "R1", "status": "SETTLED"})
+    assert response.status_code == 200
+    assert response.get_json()["queued"] == 1
@@ -0,0 +1,118 @@
+"""ConnectionPool: checkout timeout, recycling, idle validation and release on error."""
+import pytest
+from mysql.connector import Error
+
+import mastercard_api_app
+from mastercard_api_app import ConnectionPool, PoolExhaustedError
+
+
+class StubConnection:
+    def __init__(self, alive=True, cursor_error=None):
+        self.alive = alive
+        self.cursor_error = cursor_error
+        self.in_transaction = False
+        self.unread_result = False
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self, **kwargs):
+        if self.cursor_error:
+            raise self.cursor_error
+        raise AssertionError("unexpected cursor")
+
+    def is_connected(self):
+        return self.alive
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(factory=StubConnection, size=1, timeout=0.05, max_lifetime=60, validate_idle=60):
+    return ConnectionPool(factory, size=size, timeout=timeout, max_lifetime=max_lifetime, validate_idle=validate_idle)
+
+
+def test_checkout_times_out_when_every_connection_is_busy():
+    pool = make_pool()
+    held = pool.acquire()
+
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+    held.close()
+    assert pool.acquire() is not None
+
+
+def test_exhausted_pool_returns_503(monkeypatch):
+    pool = make_pool()
+    monkeypatch.setattr(mastercard_api_app, "db_pool", pool)
+    held = pool.acquire()
+    try:
+        response = mastercard_api_app.app.test_client().get("/transactions")
+    finally:
+        held.close()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_connections_past_max_lifetime_are_recycled():
+    pool = make_pool(max_lifetime=0)
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+
+    second = pool.acquire()
+
+    assert raw.closed and second._conn is not raw
+    assert pool.stats()["recycled"] >= 1
+
+
+def test_dead_idle_connections_are_replaced_on_checkout():
+    pool = make_pool(validate_idle=0)
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+    raw.alive = False
+
+    second = pool.acquire()
+
+    assert raw.closed and second._conn is not raw
+    assert pool.stats()["discarded"] == 1
+
+
+def test_release_rolls_back_only_open_transactions():
+    pool = make_pool()
+    conn = pool.acquire()
+    raw = conn._conn
+    conn.close()
+    assert raw.rollbacks == 0
+
+    conn = pool.acquire()
+    raw.in_transaction = True
+    conn.close()
+    assert raw.rollbacks == 1
+
+
+def test_failed_cursor_still_returns_the_connection(monkeypatch):
+    pool = make_pool(factory=lambda: StubConnection(cursor_error=Error("MySQL Connection not available.")))
+    monkeypatch.setattr(mastercard_api_app, "db_pool", pool)
+
+    for _ in range(2):
+        assert mastercard_api_app._log_payment_request_db({"invoice": "POOL-INV-1"}) == (False, None)
+
+    assert pool.stats()["in_use"] == 0
+
+
+def test_disabled_prewarm_is_not_reported_as_a_failed_connection(monkeypatch, caplog):
+    monkeypatch.setattr(mastercard_api_app, "DB_POOL_PREWARM", 0)
+
+    with caplog.at_level("INFO", logger="mastercard_api"):
+        assert mastercard_api_app.init_db() is None
+
+    assert "pre-warm disabled" in caplog.text
+    assert "connection failed" not in caplog.text
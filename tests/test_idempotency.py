@@ -0,0 +1,54 @@
+"""Synchronous (write-behind off) idempotency: cache keys and the in-flight guard."""
+import threading
+
+import pytest
+
+from benchmarks import fake_mysql
+import mastercard_api_app
+from mastercard_api_app import idempotency_key
+
+
+@pytest.fixture
+def synchronous(monkeypatch):
+    monkeypatch.setattr(mastercard_api_app, "WRITE_BEHIND_ENABLED", False)
+    monkeypatch.setattr(mastercard_api_app, "payment_journal", None)
+    return mastercard_api_app.app.test_client()
+
+
+def payment(invoice, amount=125.5):
+    return {"vendorId": "V1001", "invoice": invoice, "amount": amount, "currency": "INR"}
+
+
+def stored_rows(invoice):
+    return [row for row in list(fake_mysql._rows.values()) if row["REFERENCE"] == invoice]
+
+
+def test_null_invoices_are_never_deduplicated(synchronous):
+    first = synchronous.post("/mastercard/submit_payment", json=payment(None, 10)).get_json()["request_id"]
+    second = synchronous.post("/mastercard/submit_payment", json=payment(None, 20)).get_json()["request_id"]
+
+    assert first != second
+    assert first in fake_mysql._rows and second in fake_mysql._rows
+
+
+def test_cache_keys_keep_invoice_types_apart():
+    assert idempotency_key(None) is None
+    assert idempotency_key(123) != idempotency_key("123")
+
+
+def test_concurrent_submissions_insert_once(synchronous, monkeypatch):
+    monkeypatch.setitem(fake_mysql._config, "latency", 0.005)
+    request_ids = []
+
+    def submit():
+        response = mastercard_api_app.app.test_client().post("/mastercard/submit_payment", json=payment("SYNC-INV-1"))
+        request_ids.append(response.get_json()["request_id"])
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(request_ids) == 8 and len(set(request_ids)) == 1
+    assert len(stored_rows("SYNC-INV-1")) == 1
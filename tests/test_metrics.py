@@ -0,0 +1,95 @@
+"""Cross-worker metrics: exited workers are archived, pool/cache totals are counters."""
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import mastercard_api_app
+from mastercard_api_app import MetricsRegistry
+
+
+def exited_pid():
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def counter_value(text, series):
+    for line in text.splitlines():
+        if line.startswith(mastercard_api_app.METRICS_PREFIX + series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def write_worker_file(directory, pid, instance, requests_total):
+    with open(os.path.join(directory, f"worker-{pid}.json"), "w") as fh:
+        json.dump({"pid": pid, "instance": instance, "counters": [["requests_total", [], requests_total]],
+                   "histograms": [], "gauges": [["db_pool_in_use", [], 3]]}, fh)
+
+
+def test_exited_worker_is_folded_into_the_archive(tmp_path):
+    registry = MetricsRegistry(mastercard_api_app.METRICS_BUCKETS, str(tmp_path))
+    registry.inc("requests_total", value=2)
+    write_worker_file(tmp_path, exited_pid(), "gone", 5)
+
+    text = registry.render_prometheus()
+
+    assert counter_value(text, "requests_total") == 7
+    assert "db_pool_in_use" not in text
+    assert sorted(os.listdir(tmp_path)) == [".lock", "archive.json", f"worker-{os.getpid()}.json"]
+    # Scraping again must not count the archived worker twice.
+    assert counter_value(registry.render_prometheus(), "requests_total") == 7
+
+
+def test_reused_pid_does_not_make_counters_go_backwards(tmp_path):
+    write_worker_file(tmp_path, os.getpid(), "previous-incarnation", 5)
+    registry = MetricsRegistry(mastercard_api_app.METRICS_BUCKETS, str(tmp_path))
+    registry.inc("requests_total")
+
+    assert counter_value(registry.render_prometheus(), "requests_total") == 6
+
+
+def test_retire_archives_this_worker_on_exit(tmp_path):
+    registry = MetricsRegistry(mastercard_api_app.METRICS_BUCKETS, str(tmp_path))
+    registry.inc("requests_total", value=4)
+    registry.write_snapshot()
+
+    registry.retire()
+
+    assert not os.path.exists(tmp_path / f"worker-{os.getpid()}.json")
+    assert counter_value(MetricsRegistry(mastercard_api_app.METRICS_BUCKETS, str(tmp_path)).render_prometheus(),
+                         "requests_total") == 4
+
+
+def test_pool_and_cache_totals_are_exported_as_counters():
+    text = mastercard_api_app.metrics.render_prometheus()
+
+    for name in ("db_pool_checkouts_total", "db_pool_timeouts_total", "db_pool_wait_seconds_total", "cache_hits_total"):
+        assert f"# TYPE {mastercard_api_app.METRICS_PREFIX}{name} counter" in text
+    assert f"# TYPE {mastercard_api_app.METRICS_PREFIX}cache_size gauge" in text
+
+
+def test_concurrent_snapshot_writes_never_publish_a_corrupt_file(tmp_path):
+    registry = MetricsRegistry(mastercard_api_app.METRICS_BUCKETS, str(tmp_path))
+    registry.inc("requests_total")
+    registry.write_snapshot()
+    errors = []
+
+    def write_many():
+        try:
+            for _ in range(200):
+                registry.write_snapshot()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(tmp_path / f"worker-{os.getpid()}.json") as fh:
+        assert json.load(fh)["counters"] == [["requests_total", [], 1]]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
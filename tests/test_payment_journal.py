@@ -0,0 +1,92 @@
+"""PaymentJournal file handling: torn-tail repair, checkpoints and compaction."""
+import json
+
+import mysql.connector
+
+import mastercard_api_app
+from mastercard_api_app import PaymentJournal
+
+
+def record(invoice):
+    return (json.dumps({"request_id": invoice, "payload": {"invoice": invoice}}) + "\n").encode("utf-8")
+
+
+def test_torn_record_larger_than_one_read_chunk_keeps_earlier_records(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    complete = record("J-1") + record("J-2") + record("J-3")
+    path.write_bytes(complete + b'{"payload": "' + b"x" * 70000)
+
+    PaymentJournal(str(path))
+
+    assert path.read_bytes() == complete
+
+
+def test_torn_tail_repair_never_truncates_below_the_checkpoint(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    drained = record("J-1") + record("J-2")
+    path.write_bytes(drained + b'{"payload": "' + b"x" * 70000)
+    (tmp_path / "journal.jsonl.offset").write_text(str(len(drained)))
+
+    PaymentJournal(str(path))
+
+    assert path.read_bytes() == drained
+
+
+def journal_with(tmp_path, invoices):
+    journal = PaymentJournal(str(tmp_path / "journal.jsonl"))
+    for invoice in invoices:
+        journal.append({"request_id": f"id-{invoice}", "received_at": "2024-01-01T00:00:00",
+                        "payload": {"invoice": invoice}})
+    return journal
+
+
+def test_permanently_rejected_record_is_dead_lettered(tmp_path, monkeypatch):
+    stored = []
+
+    def fake_batch(payloads, *args, **kwargs):
+        if any(p["invoice"] == "BAD" for p in payloads):
+            raise mysql.connector.DataError("Data too long for column 'VENDOR_ID'")
+        stored.extend(p["invoice"] for p in payloads)
+        return True, None
+
+    monkeypatch.setattr(mastercard_api_app, "log_payment_batch", fake_batch)
+    journal = journal_with(tmp_path, ["OK-1", "OK-2", "BAD", "OK-3", "OK-4"])
+
+    assert journal.drain_once() == 5
+
+    assert sorted(stored) == ["OK-1", "OK-2", "OK-3", "OK-4"]
+    assert journal.lag_bytes() == 0
+    dead = [json.loads(line) for line in open(journal.dead_letter_path)]
+    assert [entry["record"]["payload"]["invoice"] for entry in dead] == ["BAD"]
+
+
+def test_unavailable_database_is_retried_not_dead_lettered(tmp_path, monkeypatch):
+    def failing_batch(payloads, *args, **kwargs):
+        raise mysql.connector.OperationalError("Lost connection to MySQL server")
+
+    monkeypatch.setattr(mastercard_api_app, "log_payment_batch", failing_batch)
+    journal = journal_with(tmp_path, ["OK-1", "OK-2"])
+
+    assert journal.drain_once() == 0
+
+    assert journal.lag_bytes() > 0
+    assert journal.stats()["dead_lettered"] == 0
+
+
+def test_compaction_resets_the_checkpoint_before_truncating(tmp_path, monkeypatch):
+    monkeypatch.setattr(mastercard_api_app, "JOURNAL_COMPACT_BYTES", 1)
+    journal = journal_with(tmp_path, ["C-1"])
+    size = journal.lag_bytes()
+    journal._write_checkpoint(size)
+    seen = []
+    write_checkpoint = journal._write_checkpoint
+
+    def record_file_size(offset):
+        seen.append((offset, (tmp_path / "journal.jsonl").stat().st_size))
+        write_checkpoint(offset)
+
+    monkeypatch.setattr(journal, "_write_checkpoint", record_file_size)
+    journal._compact(size)
+
+    assert seen == [(0, size)]
+    assert (tmp_path / "journal.jsonl").stat().st_size == 0
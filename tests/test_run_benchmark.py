@@ -0,0 +1,24 @@
+"""Benchmark harness helpers."""
+from benchmarks import run_benchmark
+from benchmarks.run_benchmark import percentile
+
+
+def test_percentile_uses_nearest_rank():
+    hundred = list(range(1, 101))
+    ten = list(range(1, 11))
+
+    assert (percentile(hundred, 50), percentile(hundred, 95), percentile(hundred, 99)) == (50, 95, 99)
+    assert (percentile(ten, 50), percentile(ten, 100)) == (5, 10)
+    assert percentile([], 99) == 0.0
+
+
+class FakeMetricsResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_round_trips_missing_series_depends_on_the_server(monkeypatch):
+    monkeypatch.setattr(run_benchmark.requests, "get", lambda url, timeout: FakeMetricsResponse("# no series\n"))
+
+    assert run_benchmark.db_round_trips("http://bench", fake_db=True) == 0
+    assert run_benchmark.db_round_trips("http://elsewhere", fake_db=False) is None
@@ -0,0 +1,87 @@
+"""Settlement write-behind: the queue bound must hold while the DB is down, and shutdown must flush."""
+import mysql.connector
+
+import mastercard_api_app
+from mastercard_api_app import SettlementPipeline
+
+
+def confirmations(count, status="SETTLED"):
+    return [{"reference": f"SP-REF-{i}", "status": status} for i in range(count)]
+
+
+def test_pending_stays_bounded_while_flushes_fail(monkeypatch):
+    monkeypatch.setattr(mastercard_api_app, "get_db_connection", lambda: None)
+    pipeline = SettlementPipeline(max_queue=10, batch_size=4, flush_interval=0.01)
+
+    assert pipeline.enqueue(confirmations(10)) == 10
+    for _ in range(5):
+        pipeline._collect()
+        assert not pipeline.flush()
+
+    assert len(pipeline._pending) == 4
+    assert pipeline.depth() == 6
+    # Backpressure reaches the caller instead of piling up in memory.
+    assert pipeline.enqueue(confirmations(10)) == 4
+    assert pipeline.enqueue(confirmations(1)) == 0
+
+
+def test_shutdown_flushes_pending_and_queued_confirmations():
+    pipeline = SettlementPipeline(max_queue=10, batch_size=2, flush_interval=0.01)
+    pipeline.enqueue(confirmations(5))
+    pipeline._collect()
+
+    pipeline.shutdown(timeout=5)
+
+    assert pipeline._pending == {} and pipeline.depth() == 0
+    assert pipeline.stats()["references_flushed"] == 5
+
+
+def test_overlong_status_is_rejected_at_the_endpoint():
+    client = mastercard_api_app.app.test_client()
+    too_long = "S" * (mastercard_api_app.SETTLEMENT_STATUS_MAX_LENGTH + 1)
+
+    response = client.post("/mastercard/receive_settlement_confirmation", json=[
+        {"reference": "R1", "status": "SETTLED"}, {"reference": "R2", "status": too_long}, {"reference": "R3", "status": 7}])
+
+    assert response.status_code == 400
+    assert response.get_json()["message"].endswith("index: 1, 2")
+
+
+class RejectingConnection:
+    """Commits every UPDATE except those setting STATUS='BAD', which the DB rejects."""
+    updated = []
+
+    def __init__(self):
+        self.uncommitted = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        if params[0] == "BAD":
+            raise mysql.connector.DataError("Data too long for column 'STATUS'")
+        self.rowcount = len(params) - 2
+        self.uncommitted.extend(params[2:])
+
+    def commit(self):
+        self.updated.extend(self.uncommitted)
+
+    def rollback(self):
+        self.uncommitted = []
+
+    def close(self):
+        pass
+
+
+def test_rejected_status_is_dropped_instead_of_blocking_the_queue(monkeypatch):
+    RejectingConnection.updated = []
+    monkeypatch.setattr(mastercard_api_app, "get_db_connection", RejectingConnection)
+    pipeline = SettlementPipeline(max_queue=10, batch_size=10, flush_interval=0.01)
+    pipeline.enqueue(confirmations(3) + [{"reference": "SP-REF-BAD", "status": "BAD"}])
+    pipeline._collect()
+
+    assert pipeline.flush()
+
+    assert sorted(RejectingConnection.updated) == ["SP-REF-0", "SP-REF-1", "SP-REF-2"]
+    assert pipeline._pending == {}
+    assert pipeline.stats()["dropped"] == 1
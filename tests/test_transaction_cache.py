@@ -0,0 +1,70 @@
+"""Read-through cache behind GET /transactions/<request_id>."""
+import time
+import uuid
+
+from benchmarks import fake_mysql
+import mastercard_api_app
+from mastercard_api_app import SettlementPipeline, log_payment_batch
+
+
+def payment(invoice):
+    return {"vendorId": "V1001", "invoice": invoice, "amount": 125.5, "currency": "INR"}
+
+
+def store(invoice):
+    request_id = str(uuid.uuid4())
+    assert log_payment_batch([payment(invoice)], request_ids=[request_id], use_cache=False)[0]
+    return request_id
+
+
+def test_unknown_request_id_is_cached_negatively_until_it_is_inserted():
+    client = mastercard_api_app.app.test_client()
+    request_id = str(uuid.uuid4())
+    assert client.get(f"/transactions/{request_id}").status_code == 404
+
+    # A row written behind the app's back stays hidden for TRANSACTION_NEGATIVE_TTL...
+    fake_mysql._rows[request_id] = {"REQUEST_ID": request_id, "REFERENCE": None, "LAST_UPDATED": None}
+    assert client.get(f"/transactions/{request_id}").status_code == 404
+    del fake_mysql._rows[request_id]
+
+    # ...but an insert through the app invalidates the negative entry at once.
+    assert log_payment_batch([payment("TC-INV-1")], request_ids=[request_id], use_cache=False)[0]
+    response = client.get(f"/transactions/{request_id}")
+    assert response.status_code == 200
+    assert response.get_json()["REFERENCE"] == "TC-INV-1"
+
+
+def test_negative_entries_expire(monkeypatch):
+    monkeypatch.setattr(mastercard_api_app, "TRANSACTION_NEGATIVE_TTL", 0.05)
+    client = mastercard_api_app.app.test_client()
+    request_id = str(uuid.uuid4())
+    assert client.get(f"/transactions/{request_id}").status_code == 404
+
+    fake_mysql._rows[request_id] = {"REQUEST_ID": request_id, "REFERENCE": None, "LAST_UPDATED": None}
+    time.sleep(0.1)
+    assert client.get(f"/transactions/{request_id}").status_code == 200
+
+
+def test_settlement_flush_invalidates_the_cached_row():
+    client = mastercard_api_app.app.test_client()
+    request_id = store("TC-INV-2")
+    assert client.get(f"/transactions/{request_id}").get_json()["STATUS"] == "INITIATED"
+
+    pipeline = SettlementPipeline(max_queue=10, batch_size=10, flush_interval=0.01)
+    pipeline.enqueue([{"reference": "TC-INV-2", "status": "SETTLED"}])
+    pipeline._collect()
+    assert pipeline.flush()
+
+    assert client.get(f"/transactions/{request_id}").get_json()["STATUS"] == "SETTLED"
+
+
+def test_conditional_get_returns_304():
+    client = mastercard_api_app.app.test_client()
+    request_id = store("TC-INV-3")
+    first = client.get(f"/transactions/{request_id}")
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    assert client.get(f"/transactions/{request_id}", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert client.get(f"/transactions/{request_id}",
+                      headers={"If-Modified-Since": first.headers["Last-Modified"]}).status_code == 304
+    assert client.get(f"/transactions/{request_id}", headers={"If-None-Match": 'W/"stale"'}).status_code == 200
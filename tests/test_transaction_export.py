@@ -0,0 +1,83 @@
+"""/transactions/export and its query builder: own connections, keyset cursor, aborted streams."""
+import datetime
+
+import mysql.connector
+import pytest
+
+import mastercard_api_app
+from mastercard_api_app import build_transaction_query, encode_page_cursor
+
+
+def test_keyset_cursor_uses_row_constructor():
+    cursor = encode_page_cursor({"RECEIVED_AT": datetime.datetime(2024, 1, 2, 3, 4, 5), "REQUEST_ID": "abc"})
+    sql, params, _ = build_transaction_query({"after": cursor})
+
+    assert "WHERE (RECEIVED_AT, REQUEST_ID) > (%s, %s)" in sql
+    assert params == [datetime.datetime(2024, 1, 2, 3, 4, 5), "abc"]
+
+
+def test_export_skips_the_pool_and_is_capped(monkeypatch):
+    client = mastercard_api_app.app.test_client()
+    opened = []
+    monkeypatch.setattr(mastercard_api_app, "create_db_connection", lambda: opened.append(1))
+    checkouts_before = mastercard_api_app.db_pool.stats()["checkouts"]
+
+    # A failed connect gives its slot back, so repeated failures never lock exports out.
+    for _ in range(mastercard_api_app.EXPORT_MAX_CONCURRENT + 1):
+        assert client.get("/transactions/export").status_code == 503
+    assert len(opened) == mastercard_api_app.EXPORT_MAX_CONCURRENT + 1
+    assert mastercard_api_app.db_pool.stats()["checkouts"] == checkouts_before
+
+    # With every slot busy the request is refused before a connection is opened.
+    for _ in range(mastercard_api_app.EXPORT_MAX_CONCURRENT):
+        mastercard_api_app.export_slots.acquire()
+    try:
+        response = client.get("/transactions/export")
+        assert response.status_code == 503
+        assert "Too many exports" in response.get_json()["message"]
+        assert len(opened) == mastercard_api_app.EXPORT_MAX_CONCURRENT + 1
+    finally:
+        for _ in range(mastercard_api_app.EXPORT_MAX_CONCURRENT):
+            mastercard_api_app.export_slots.release()
+
+
+class FailingExportConnection:
+    """Returns one page of rows, then loses the connection mid-stream."""
+
+    def __init__(self):
+        self.pages = [[{column: None for column in mastercard_api_app.TRANSACTION_COLUMNS}]]
+
+    def cursor(self, **kwargs):
+        return self
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchmany(self, size):
+        if not self.pages:
+            raise mysql.connector.OperationalError("Lost connection to MySQL server during query")
+        return self.pages.pop()
+
+    def close(self):
+        pass
+
+
+def test_db_error_mid_stream_aborts_the_response(monkeypatch):
+    monkeypatch.setattr(mastercard_api_app, "create_db_connection", FailingExportConnection)
+    response = mastercard_api_app.app.test_client().get("/transactions/export", buffered=False)
+    assert response.status_code == 200
+
+    with pytest.raises(mysql.connector.Error):
+        b"".join(response.response)
+    response.close()
+    assert mastercard_api_app.export_slots.acquire(blocking=False)
+    mastercard_api_app.export_slots.release()
+
+
+def test_empty_status_filter_is_rejected_with_400():
+    client = mastercard_api_app.app.test_client()
+
+    for path in ("/transactions?status=,", "/transactions/export?status=%20,"):
+        response = client.get(path)
+        assert response.status_code == 400
+        assert "'status'" in response.get_json()["message"]
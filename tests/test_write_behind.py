@@ -0,0 +1,68 @@
+"""
+Write-behind journal: an acknowledged payment must end up in PAYMENT_REQUEST.
+Runs the real app against benchmarks.fake_mysql with WRITE_BEHIND_ENABLED=1 (see conftest.py).
+"""
+import threading
+import time
+
+from benchmarks import fake_mysql
+import mastercard_api_app
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def payment(invoice):
+    return {"vendorId": "V1001", "invoice": invoice, "amount": 125.5, "currency": "INR"}
+
+
+def test_journaled_payment_is_drained_into_db():
+    client = mastercard_api_app.app.test_client()
+
+    response = client.post("/mastercard/submit_payment", json=payment("WB-INV-1"))
+    assert response.status_code == 202
+    request_id = response.get_json()["request_id"]
+
+    # The invoice is now in the idempotency cache; draining must still insert it.
+    assert wait_for(lambda: "WB-INV-1" in fake_mysql._by_reference)
+    assert fake_mysql._by_reference["WB-INV-1"] == request_id
+    assert fake_mysql._rows[request_id]["STATUS"] == "INITIATED"
+    assert wait_for(lambda: mastercard_api_app.payment_journal.lag_bytes() == 0)
+
+
+def test_retry_on_another_worker_gets_the_stored_request_id():
+    client = mastercard_api_app.app.test_client()
+
+    first = client.post("/mastercard/submit_payment", json=payment("WB-INV-2")).get_json()["request_id"]
+    # Another worker (or this one after the cache TTL) has no memory of the invoice.
+    mastercard_api_app.idempotency_cache.invalidate("WB-INV-2")
+    retry = client.post("/mastercard/submit_payment", json=payment("WB-INV-2")).get_json()["request_id"]
+
+    assert retry == first
+    assert wait_for(lambda: "WB-INV-2" in fake_mysql._by_reference)
+    assert client.get(f"/transactions/{first}").status_code == 200
+
+
+def test_concurrent_retries_are_journaled_once():
+    client_factory = mastercard_api_app.app.test_client
+    appended_before = mastercard_api_app.payment_journal.stats()["appended"]
+    request_ids = []
+
+    def submit():
+        response = client_factory().post("/mastercard/submit_payment", json=payment("WB-INV-3"))
+        request_ids.append(response.get_json()["request_id"])
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(request_ids)) == 1
+    assert mastercard_api_app.payment_journal.stats()["appended"] == appended_before + 1